@@ -50,6 +50,31 @@ DEFAULT_CONFIG = {
     ],
     "social_protection_masking_enabled": True,
     "enable_python_workflows": True,
+    "enable_chunked_beneficiary_import": False,
+    "beneficiary_import_chunk_size": 10000,
+    "beneficiary_import_batch_size": 1000,
+    # Either "orm" or "copy", "copy" streams uploaded rows with PostgreSQL COPY and falls back to "orm" on other databases
+    "beneficiary_import_ingestion_backend": "orm",
+    "enable_column_validation": False,
+    # one of "inline", "thread", "process"
+    "validation_executor": "process",
+    "validation_workers": 4,
+    "validation_inline_threshold": 1000,
+    "enable_bulk_reporting_synchronization": False,
+    "beneficiary_status_transition_batch_size": 5000,
+    "enable_async_benefit_plan_closing": False,
+    "enrollment_batch_size": 1000,
+    # empty to run upload workflows in the upload request, otherwise one of "thread", "database"
+    "beneficiary_upload_queue": "",
+    # seconds after which a queued upload still in progress is failed, 0 to never fail it
+    "beneficiary_upload_queue_timeout": 86400,
+    # dotted paths of callables receiving (upload_id, stage, stats) of every upload pipeline stage
+    "upload_metrics_hooks": [],
+    "enable_python_json_schema_validation": False,
+    "beneficiary_update_batch_size": 10000,
+    "enable_eligibility_snapshots": False,
+    "eligibility_snapshot_ttl": 3600,
+    "enable_json_field_indexes": False,
 }
 
 
@@ -94,6 +119,27 @@ class SocialProtectionConfig(AppConfig):
     group_beneficiary_mask_fields = None
     social_protection_masking_enabled = None
 
+    enable_chunked_beneficiary_import = None
+    beneficiary_import_chunk_size = None
+    beneficiary_import_batch_size = None
+    beneficiary_import_ingestion_backend = None
+    enable_column_validation = None
+    validation_executor = None
+    validation_workers = None
+    validation_inline_threshold = None
+    enable_bulk_reporting_synchronization = None
+    beneficiary_status_transition_batch_size = None
+    enable_async_benefit_plan_closing = None
+    enrollment_batch_size = None
+    beneficiary_upload_queue = None
+    beneficiary_upload_queue_timeout = None
+    upload_metrics_hooks = None
+    enable_python_json_schema_validation = None
+    beneficiary_update_batch_size = None
+    enable_eligibility_snapshots = None
+    eligibility_snapshot_ttl = None
+    enable_json_field_indexes = None
+
     def ready(self):
         from core.models import ModuleConfiguration
 
@@ -0,0 +1,69 @@
+"""
+Bulk ingestion of IndividualDataSource rows with PostgreSQL ``COPY ... FROM STDIN``.
+
+Rows are written to the table as CSV, primary keys, user columns and timestamps are generated while the stream
+is written, so no model instance is created for an uploaded row. Available only on PostgreSQL,
+callers should check ``is_copy_ingestion_supported`` and fall back to the ORM otherwise.
+"""
+import csv
+import datetime
+import io
+import json
+import uuid
+from itertools import islice
+from typing import Iterable
+
+from django.db import connection
+
+from individual.models import IndividualDataSource, IndividualDataSourceUpload
+
+COPY_FIELDS = (
+    'id', 'upload', 'json_ext', 'validations', 'is_deleted', 'version',
+    'date_created', 'date_updated', 'user_created', 'user_updated',
+)
+
+
+def is_copy_ingestion_supported() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def copy_individual_data_sources(records: Iterable[dict], upload: IndividualDataSourceUpload, user,
+                                 batch_size: int) -> int:
+    """
+    Stream records into individual data source table, each batch of records is sent with a single COPY statement.
+    Returns number of inserted rows.
+    """
+    sql = _build_copy_sql()
+    now = datetime.datetime.now().isoformat()
+    records = iter(records)
+    inserted = 0
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                return inserted
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for record in batch:
+                writer.writerow((uuid.uuid4(), upload.id, json.dumps(record), '{}', 'f', 1, now, now, user.id, user.id))
+            buffer.seek(0)
+            _copy_from_buffer(cursor, sql, buffer)
+            inserted += len(batch)
+
+
+def _build_copy_sql() -> str:
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(IndividualDataSource._meta.get_field(field).column) for field in COPY_FIELDS)
+    table = quote_name(IndividualDataSource._meta.db_table)
+    return f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)'
+
+
+def _copy_from_buffer(cursor, sql: str, buffer: io.StringIO):
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+        # psycopg2
+        raw_cursor.copy_expert(sql, buffer)
+    else:
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
@@ -2,6 +2,7 @@ import logging
 import re
 
 from collections import namedtuple
+from django.db.models import Exists, OuterRef, Q
 from django.db.models.query import QuerySet
 from typing import List
 
@@ -65,7 +66,22 @@ class BenefitPlanCustomFilterWizard(CustomFilterWizardInterface):
         :type relation: str or None
 
         :return: The updated queryset with additional filters applied for example: Queryset[Beneficiary].
+
+        All filters are merged into a single condition. With a relation, the condition is checked with one
+        Exists subquery, so all filters have to match the same related object, the related tables are joined once
+        and the result doesn't need DISTINCT.
+        """
+        conditions = self.compile_filters(custom_filters, relation)
+        if not relation:
+            return query.filter(conditions)
+        related_match = query.model._base_manager.filter(conditions, pk=OuterRef('pk'))
+        return query.filter(Exists(related_match))
+
+    def compile_filters(self, custom_filters: List[namedtuple], relation=None) -> Q:
+        """
+        Merge custom filters into a single Q on json_ext of the queryset model or of the given relation.
         """
+        conditions = Q()
         for filter_part in custom_filters:
             if isinstance(filter_part, dict):
                 value_type = filter_part['type']
@@ -75,9 +91,8 @@ class BenefitPlanCustomFilterWizard(CustomFilterWizardInterface):
                 field, value = filter_part.split('=')
                 field, value_type = field.rsplit('__', 1)
             value = self.__cast_value(value, value_type)
-            filter_kwargs = {f"{relation}__json_ext__{field}" if relation else f"json_ext__{field}": value}
-            query = query.filter(**filter_kwargs).distinct()
-        return query
+            conditions &= Q(**{f"{relation}__json_ext__{field}" if relation else f"json_ext__{field}": value})
+        return conditions
 
     def __process_schema_and_build_tuple(
             self,
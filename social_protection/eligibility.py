@@ -0,0 +1,86 @@
+"""
+Snapshots of the beneficiaries matching the advanced criteria of a benefit plan.
+
+With ``enable_eligibility_snapshots`` the criteria of a (benefit plan, status) pair are evaluated once and the ids of
+the eligible beneficiaries are stored in ``EligibilitySnapshotEntry``. Beneficiary queries then check each row of
+the page with an index lookup, instead of evaluating the criteria over the whole plan. Snapshots are keyed by
+the hash of the criteria, they are dropped when beneficiaries of the plan are changed by the services or uploads
+and rebuilt after ``eligibility_snapshot_ttl`` seconds, as criteria can also depend on changed individual data.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef
+from django.utils import timezone
+
+from social_protection.apps import SocialProtectionConfig
+from social_protection.models import EligibilitySnapshot, EligibilitySnapshotEntry
+
+logger = logging.getLogger(__name__)
+
+
+def is_eligibility_snapshot_enabled():
+    return bool(SocialProtectionConfig.enable_eligibility_snapshots)
+
+
+def get_eligible_subquery(benefit_plan, status, criteria, eligible_query):
+    """
+    Subquery of the eligible rows correlated to the 'id' of the outer beneficiary query, to be used with Exists.
+    """
+    if not is_eligibility_snapshot_enabled():
+        return eligible_query.filter(id=OuterRef('id'))
+    snapshot = get_or_create_snapshot(benefit_plan, status, criteria, eligible_query)
+    return EligibilitySnapshotEntry.objects.filter(snapshot=snapshot, beneficiary_id=OuterRef('id'))
+
+
+def get_or_create_snapshot(benefit_plan, status, criteria, eligible_query):
+    criteria_hash = _hash_criteria(criteria)
+    snapshots = EligibilitySnapshot.objects.filter(benefit_plan=benefit_plan, status=status)
+    snapshot = snapshots.filter(criteria_hash=criteria_hash).first()
+    ttl = SocialProtectionConfig.eligibility_snapshot_ttl
+    if snapshot and ttl and snapshot.date_created < timezone.now() - timedelta(seconds=ttl):
+        snapshot.delete()
+        snapshot = None
+    if snapshot:
+        return snapshot
+
+    try:
+        with transaction.atomic():
+            # Snapshots of the previous criteria of the status won't be used anymore
+            snapshots.exclude(criteria_hash=criteria_hash).delete()
+            snapshot = EligibilitySnapshot.objects.create(
+                benefit_plan=benefit_plan, status=status, criteria_hash=criteria_hash
+            )
+            _create_entries(snapshot, eligible_query.filter(benefit_plan_id=benefit_plan.id))
+    except IntegrityError:
+        # Snapshot built concurrently by another request
+        return snapshots.get(criteria_hash=criteria_hash)
+    return snapshot
+
+
+def invalidate_eligibility_snapshots(benefit_plan_id):
+    if benefit_plan_id:
+        EligibilitySnapshot.objects.filter(benefit_plan_id=benefit_plan_id).delete()
+
+
+def _create_entries(snapshot, eligible_query):
+    batch_size = SocialProtectionConfig.enrollment_batch_size
+    ids = eligible_query.order_by().values_list('id', flat=True).distinct().iterator(chunk_size=batch_size)
+    created = 0
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            break
+        EligibilitySnapshotEntry.objects.bulk_create(
+            [EligibilitySnapshotEntry(snapshot=snapshot, beneficiary_id=beneficiary_id) for beneficiary_id in batch]
+        )
+        created += len(batch)
+    logger.debug("Eligibility snapshot %s created with %s beneficiaries", snapshot.id, created)
+
+
+def _hash_criteria(criteria):
+    return hashlib.sha256(json.dumps(criteria, sort_keys=True, default=str).encode()).hexdigest()
@@ -1,8 +1,14 @@
 import graphene
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Cast
 from graphene import ObjectType
+from graphene.types.generic import GenericScalar
 from graphene_django import DjangoObjectType
 import django_filters
+import graphene_django_optimizer as gql_optimizer
 from graphene_django.filter import DjangoFilterConnectionField
 
 from contribution_plan.models import PaymentPlan
@@ -11,6 +17,7 @@ from individual.gql_queries import IndividualGQLType, GroupGQLType, \
     IndividualDataSourceUploadGQLType
 from social_protection.apps import SocialProtectionConfig
 from social_protection.models import Beneficiary, BenefitPlan, GroupBeneficiary, BenefitPlanDataUploadRecords
+from social_protection.upload_metrics import STATS_KEY
 
 
 def _have_permissions(user, permission):
@@ -21,6 +28,31 @@ def _have_permissions(user, permission):
     return user.has_perms(permission)
 
 
+def annotate_has_payment_plans(queryset):
+    """
+    Computes has_payment_plans of all benefit plans (or their history rows) of the queryset within the query,
+    instead of one query per resolved node. PaymentPlan stores the benefit plan id as text, casting the UUID matches
+    it only on PostgreSQL (lowercase hyphenated text), on other databases it's resolved per node.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset
+    return queryset.annotate(has_payment_plans=Exists(
+        _benefit_plan_payment_plans().filter(benefit_plan_id=Cast(OuterRef('id'), models.CharField()))
+    ))
+
+
+def _resolve_has_payment_plans(benefit_plan):
+    if hasattr(benefit_plan, 'has_payment_plans'):
+        return benefit_plan.has_payment_plans
+    # Benefit plan not loaded with annotate_has_payment_plans, e.g. resolved as a relation of another node
+    return _benefit_plan_payment_plans().filter(benefit_plan_id=benefit_plan.id).exists()
+
+
+def _benefit_plan_payment_plans():
+    # benefit_plan_id is a generic relation, ids of other entity types must not match
+    return PaymentPlan.objects.filter(benefit_plan_type=ContentType.objects.get_for_model(BenefitPlan))
+
+
 class JsonExtMixin:
     def resolve_json_ext(self, info):
         if _have_permissions(info.context.user, SocialProtectionConfig.gql_schema_search_perms):
@@ -59,7 +91,7 @@ class BenefitPlanGQLType(DjangoObjectType, JsonExtMixin):
         return None
 
     def resolve_has_payment_plans(self, info):
-        return PaymentPlan.objects.filter(benefit_plan_id=self.id).exists()
+        return _resolve_has_payment_plans(self)
 
 class BeneficiaryFilter(django_filters.FilterSet):
     is_eligible = django_filters.BooleanFilter(method='filter_is_eligible')
@@ -135,6 +167,7 @@ class GroupBeneficiaryGQLType(DjangoObjectType, JsonExtMixin):
 
 class BenefitPlanDataUploadQGLType(DjangoObjectType, JsonExtMixin):
     uuid = graphene.String(source='uuid')
+    stats = GenericScalar()
 
     class Meta:
         model = BenefitPlanDataUploadRecords
@@ -151,6 +184,10 @@ class BenefitPlanDataUploadQGLType(DjangoObjectType, JsonExtMixin):
         }
         connection_class = ExtendedConnection
 
+    @gql_optimizer.resolver_hints(select_related=('data_upload',))
+    def resolve_stats(self, info):
+        return (self.data_upload.json_ext or {}).get(STATS_KEY)
+
 
 class BenefitPlanSchemaFieldsGQLType(ObjectType):
     schema_fields = graphene.List(graphene.String)
@@ -199,4 +236,4 @@ class BenefitPlanHistoryGQLType(DjangoObjectType, JsonExtMixin):
         return None
 
     def resolve_has_payment_plans(self, info):
-        return PaymentPlan.objects.filter(benefit_plan_id=self.id).exists()
+        return _resolve_has_payment_plans(self)
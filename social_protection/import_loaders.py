@@ -0,0 +1,133 @@
+"""
+Chunked readers for beneficiary import files.
+
+Every reader takes an uploaded file and a chunk size and yields ``pandas.DataFrame`` objects holding at most
+``chunk_size`` rows, so the memory used by an import does not depend on the size of the uploaded file.
+The first non-empty row of a spreadsheet is used as the header, same as ``pandas.read_excel`` does.
+"""
+import zipfile
+from itertools import islice
+from typing import Iterable, Iterator, List
+from xml.etree import ElementTree
+
+import pandas as pd
+
+ODS_TABLE_NS = 'urn:oasis:names:tc:opendocument:xmlns:table:1.0'
+ODS_OFFICE_NS = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0'
+ODS_TEXT_NS = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+
+ODS_TABLE = f'{{{ODS_TABLE_NS}}}table'
+ODS_ROW = f'{{{ODS_TABLE_NS}}}table-row'
+ODS_CELLS = (f'{{{ODS_TABLE_NS}}}table-cell', f'{{{ODS_TABLE_NS}}}covered-table-cell')
+ODS_PARAGRAPH = f'{{{ODS_TEXT_NS}}}p'
+ODS_COLUMNS_REPEATED = f'{{{ODS_TABLE_NS}}}number-columns-repeated'
+ODS_ROWS_REPEATED = f'{{{ODS_TABLE_NS}}}number-rows-repeated'
+ODS_VALUE_TYPE = f'{{{ODS_OFFICE_NS}}}value-type'
+
+
+def iter_csv_chunks(import_file, chunk_size: int) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(import_file, chunksize=chunk_size) as reader:
+        yield from reader
+
+
+def iter_xlsx_chunks(import_file, chunk_size: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(import_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        yield from _rows_to_chunks(rows, chunk_size)
+    finally:
+        workbook.close()
+
+
+def iter_ods_chunks(import_file, chunk_size: int) -> Iterator[pd.DataFrame]:
+    yield from _rows_to_chunks(_iter_ods_rows(import_file), chunk_size)
+
+
+def iter_excel_chunks(import_file, chunk_size: int) -> Iterator[pd.DataFrame]:
+    # Legacy .xls files can't be read row by row, the sheet is loaded once and handed over in chunks.
+    dataframe = pd.read_excel(import_file)
+    for start in range(0, len(dataframe), chunk_size):
+        yield dataframe.iloc[start:start + chunk_size]
+
+
+def _rows_to_chunks(rows: Iterable[tuple], chunk_size: int) -> Iterator[pd.DataFrame]:
+    rows = (row for row in rows if any(value is not None for value in row))
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = _build_columns(header)
+    width = len(columns)
+    while True:
+        chunk = [_fit_row(row, width) for row in islice(rows, chunk_size)]
+        if not chunk:
+            return
+        yield pd.DataFrame(chunk, columns=columns)
+
+
+def _build_columns(header: tuple) -> List[str]:
+    while header and header[-1] is None:
+        header = header[:-1]
+    return [str(value) if value is not None else f'Unnamed: {index}' for index, value in enumerate(header)]
+
+
+def _fit_row(row: tuple, width: int) -> tuple:
+    if len(row) < width:
+        return tuple(row) + (None,) * (width - len(row))
+    return tuple(row[:width])
+
+
+def _iter_ods_rows(import_file) -> Iterator[tuple]:
+    """
+    Stream rows of the first sheet of an OpenDocument spreadsheet. Processed rows are detached from the parsed tree,
+    so only the row being read is kept in memory.
+    """
+    with zipfile.ZipFile(import_file) as archive, archive.open('content.xml') as content:
+        parents = []
+        for event, element in ElementTree.iterparse(content, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag == ODS_TABLE:
+                return
+            if element.tag != ODS_ROW:
+                continue
+            row = _parse_ods_row(element)
+            repeated = int(element.get(ODS_ROWS_REPEATED, 1))
+            if parents:
+                parents[-1].remove(element)
+            if any(value is not None for value in row):
+                for _ in range(repeated):
+                    yield row
+
+
+def _parse_ods_row(row_element) -> tuple:
+    values = []
+    for cell in row_element:
+        if cell.tag not in ODS_CELLS:
+            continue
+        value = _parse_ods_cell(cell)
+        repeated = int(cell.get(ODS_COLUMNS_REPEATED, 1))
+        values.extend([value] * repeated)
+    while values and values[-1] is None:
+        values.pop()
+    return tuple(values)
+
+
+def _parse_ods_cell(cell):
+    value_type = cell.get(ODS_VALUE_TYPE)
+    if value_type in ('float', 'percentage', 'currency'):
+        value = float(cell.get(f'{{{ODS_OFFICE_NS}}}value'))
+        return int(value) if value.is_integer() else value
+    if value_type == 'boolean':
+        return cell.get(f'{{{ODS_OFFICE_NS}}}boolean-value') == 'true'
+    if value_type == 'date':
+        return pd.Timestamp(cell.get(f'{{{ODS_OFFICE_NS}}}date-value'))
+    if value_type == 'time':
+        return cell.get(f'{{{ODS_OFFICE_NS}}}time-value')
+    if value_type == 'string':
+        text = '\n'.join(''.join(paragraph.itertext()) for paragraph in cell.iter(ODS_PARAGRAPH))
+        return text or None
+    return None
@@ -0,0 +1,140 @@
+"""
+Expression indexes on ``Json_ext`` for the fields declared in benefit plan schemas.
+
+Custom filters of the beneficiary queries compare single keys of ``Json_ext``, every declared field of a filterable
+type gets an index on the same expression as the one used by the filter lookups: ``"Json_ext" -> 'field'`` for
+numbers, dates and booleans, ``UPPER("Json_ext" ->> 'field')`` for strings (case insensitive exact and prefix
+search). Indexes are created on the table read by the filters of the plan type, beneficiaries for individual plans
+and individuals for group plans, as group beneficiaries are filtered through the individuals of the group. They are
+dropped when no plan declares the field anymore. Available only on PostgreSQL, enabled with
+``enable_json_field_indexes``.
+"""
+import hashlib
+import logging
+import threading
+from typing import Dict
+
+from django.db import connection, transaction
+
+from core.custom_filters import CustomFilterWizardInterface
+from individual.models import Individual
+from social_protection.apps import SocialProtectionConfig
+from social_protection.models import BenefitPlan, Beneficiary
+
+logger = logging.getLogger(__name__)
+
+INDEX_PREFIX = 'sp_jx_'
+
+_sync_lock = threading.Lock()
+
+# Models whose Json_ext is read by the custom filters of the plan type,
+# group beneficiaries are filtered with the "group__groupindividual__individual" relation
+INDEXED_MODELS = {
+    BenefitPlan.BenefitPlanType.INDIVIDUAL_TYPE: Beneficiary,
+    BenefitPlan.BenefitPlanType.GROUP_TYPE: Individual,
+}
+
+
+def is_json_index_management_enabled():
+    return bool(SocialProtectionConfig.enable_json_field_indexes) and connection.vendor == 'postgresql'
+
+
+def schedule_json_field_index_sync():
+    """
+    Synchronize the indexes in a background thread once the current transaction is committed, e.g. after
+    a benefit plan schema change. Building indexes of a large table takes long, the request isn't blocked by it
+    and failures are only logged, the ``sync_beneficiary_json_indexes`` command can be used to run it again.
+    """
+    if is_json_index_management_enabled():
+        thread = threading.Thread(target=_sync_in_background, daemon=True)
+        transaction.on_commit(thread.start)
+
+
+def _sync_in_background():
+    try:
+        # Synchronizations triggered by concurrent benefit plan changes are run one after another
+        with _sync_lock:
+            sync_json_field_indexes()
+    except Exception as exc:
+        logger.error("Error while synchronizing JSON field indexes", exc_info=exc)
+    finally:
+        connection.close()
+
+
+def sync_json_field_indexes():
+    """
+    Create indexes of the fields declared by the benefit plans and drop the ones not declared anymore.
+    Invalid indexes, left by a failed or cancelled concurrent build, are dropped and created again.
+    Returns names of the created and dropped indexes.
+    """
+    expected = get_expected_indexes()
+    existing = get_existing_indexes()
+    invalid = {name for name, is_valid in existing.items() if not is_valid}
+    # Building an index concurrently doesn't block writes, but it can't be done in a transaction
+    concurrently = '' if connection.in_atomic_block else 'CONCURRENTLY '
+    created, dropped = [], []
+    for name in sorted((set(existing) - set(expected)) | invalid):
+        _run_ddl(f'DROP INDEX {concurrently}IF EXISTS {connection.ops.quote_name(name)}')
+        dropped.append(name)
+    for name, (table, expression) in sorted(expected.items()):
+        if existing.get(name):
+            continue
+        _run_ddl(f'CREATE INDEX {concurrently}IF NOT EXISTS {connection.ops.quote_name(name)} ON {table} ({expression})')
+        created.append(name)
+    if created or dropped:
+        logger.info("JSON field indexes synchronized, created: %s, dropped: %s", created, dropped)
+    return {'created': created, 'dropped': dropped}
+
+
+def get_expected_indexes() -> Dict[str, tuple]:
+    """
+    Maps index names to the (table, indexed expression) of every filterable field declared by the benefit plans.
+    """
+    indexes = {}
+    plans = BenefitPlan.objects \
+        .filter(is_deleted=False, beneficiary_data_schema__isnull=False) \
+        .values_list('type', 'beneficiary_data_schema')
+    for plan_type, schema in plans:
+        model = INDEXED_MODELS.get(plan_type)
+        if not model or not isinstance(schema, dict):
+            continue
+        table = connection.ops.quote_name(model._meta.db_table)
+        for field, properties in (schema.get('properties') or {}).items():
+            field_type = properties.get('type') if isinstance(properties, dict) else None
+            if field_type not in CustomFilterWizardInterface.FILTERS_BASED_ON_FIELD_TYPE:
+                continue
+            expression = _index_expression(model, field, field_type)
+            indexes[_index_name(model, expression)] = (table, expression)
+    return indexes
+
+
+def get_existing_indexes() -> Dict[str, bool]:
+    """
+    Maps names of the managed indexes to their validity, an index is invalid if its concurrent build didn't finish.
+    """
+    # All tables are checked, indexes created on tables not indexed anymore are dropped as well
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE starts_with(c.relname, %s) AND pg_table_is_visible(c.oid)',
+            [INDEX_PREFIX]
+        )
+        return dict(cursor.fetchall())
+
+
+def _run_ddl(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+def _index_expression(model, field, field_type):
+    column = connection.ops.quote_name(model._meta.get_field('json_ext').column)
+    key = "'{}'".format(field.replace("'", "''"))
+    if field_type == 'string':
+        return f'(UPPER({column} ->> {key})) text_pattern_ops'
+    return f'({column} -> {key})'
+
+
+def _index_name(model, expression):
+    digest = hashlib.sha1(f'{model._meta.db_table}:{expression}'.encode()).hexdigest()[:16]
+    return f'{INDEX_PREFIX}{model._meta.model_name}_{digest}'
@@ -0,0 +1,54 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from social_protection.utils import dataframe_to_records
+
+
+class Command(BaseCommand):
+    help = 'Compares the time needed to build IndividualDataSource json_ext records from an uploaded file ' \
+           'row by row (iterrows and to_json) and with the vectorized record builder. ' \
+           'Nothing is written to the database. For example, you can run: ' \
+           'python manage.py benchmark_beneficiary_import --sizes 10000 100000 1000000'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--skip-row-by-row', action='store_true',
+                            help='Measure only the vectorized builder, useful for the largest sizes.')
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            dataframe = self._generate_dataframe(size)
+            vectorized = self._measure(lambda: dataframe_to_records(dataframe))
+            if options['skip_row_by_row']:
+                self.stdout.write(f'{size} rows: vectorized {vectorized:.2f}s')
+                continue
+            row_by_row = self._measure(lambda: [json.loads(row.to_json()) for _, row in dataframe.iterrows()])
+            self.stdout.write(self.style.SUCCESS(
+                f'{size} rows: row by row {row_by_row:.2f}s, vectorized {vectorized:.2f}s, '
+                f'speedup x{row_by_row / vectorized:.1f}'
+            ))
+
+    @staticmethod
+    def _measure(function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _generate_dataframe(size):
+        rng = np.random.default_rng(0)
+        number_of_children = rng.integers(0, 6, size).astype(float)
+        number_of_children[rng.random(size) < 0.05] = np.nan
+        return pd.DataFrame({
+            'first_name': rng.choice(['John', 'Jane', 'Amina', 'Kofi'], size),
+            'last_name': rng.choice(['Doe', 'Smith', 'Mensah', 'Okafor'], size),
+            'dob': pd.Timestamp('1970-01-01') + pd.to_timedelta(rng.integers(0, 18000, size), unit='D'),
+            'email': [f'beneficiary{index}@example.com' for index in range(size)],
+            'able_bodied': rng.random(size) < 0.5,
+            'number_of_children': number_of_children,
+            'national_id': [f'{index:012d}' for index in range(size)],
+        })
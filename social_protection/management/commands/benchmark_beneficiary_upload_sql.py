@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import datetime
+from core.models import User
+from individual.models import IndividualDataSource, IndividualDataSourceUpload
+from social_protection.copy_ingestion import is_copy_ingestion_supported, copy_individual_data_sources
+from social_protection.models import BenefitPlan, Beneficiary
+from social_protection.workflows.beneficiary_upload_valid import upload_sql
+
+BENCHMARK_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "properties": {
+        "first_name": {"type": "string"},
+        "last_name": {"type": "string"},
+        "dob": {"type": "string"},
+        "email": {"type": "string"},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Measures the valid beneficiary upload SQL procedure on generated uploads, for example: ' \
+           'python manage.py benchmark_beneficiary_upload_sql --rows 100000 1000000. ' \
+           'Every run is done in a transaction which is rolled back, so no data is left in the database. ' \
+           'Requires PostgreSQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000],
+                            help='Sizes of the generated uploads.')
+        parser.add_argument('--username', default='admin', help='User running the upload.')
+
+    def handle(self, *args, **options):
+        if not is_copy_ingestion_supported():
+            raise CommandError('The benchmark requires PostgreSQL.')
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f'User not found: {options["username"]}')
+
+        for rows in options['rows']:
+            with transaction.atomic():
+                self._benchmark(rows, user)
+                transaction.set_rollback(True)
+
+    def _benchmark(self, rows, user):
+        benefit_plan = BenefitPlan(
+            code='BENCH', name='Upload benchmark', max_beneficiaries=0, beneficiary_data_schema=BENCHMARK_SCHEMA,
+            date_valid_from=datetime.date.today(), date_valid_to=datetime.date.today(),
+        )
+        benefit_plan.save(username=user.login_name)
+        upload = IndividualDataSourceUpload(source_name='benchmark', source_type='beneficiary import')
+        upload.save(username=user.login_name)
+
+        records = ({
+            'first_name': f'First {i}', 'last_name': f'Last {i}', 'dob': '1990-01-01', 'email': f'bench{i}@example.com'
+        } for i in range(rows))
+        copy_individual_data_sources(records, upload, user, batch_size=10000)
+        IndividualDataSource.objects.filter(upload=upload).update(validations={'validation_errors': []})
+
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(upload_sql, [upload.id, user.id, benefit_plan.id, None])
+        duration = time.perf_counter() - start
+
+        upload.refresh_from_db()
+        imported = Beneficiary.objects.filter(benefit_plan=benefit_plan).count()
+        self.stdout.write(
+            f'{rows} rows: {duration:.2f}s ({rows / duration:.0f} rows/s), '
+            f'status {upload.status}, {imported} beneficiaries imported'
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from social_protection.upload_queue import process_queued_uploads, fail_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Runs workflows of beneficiary uploads queued with the "database" beneficiary_upload_queue. ' \
+           'By default the command keeps polling for new uploads, for example you can run: ' \
+           'python manage.py run_beneficiary_upload_queue --interval 5. ' \
+           'With --once, queued uploads are processed and the command exits, e.g. when run from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process queued uploads and exit.')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between polls of the queue.')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of uploads taken in one poll.')
+
+    def handle(self, *args, **options):
+        while True:
+            failed = fail_stale_uploads()
+            if failed:
+                self.stdout.write(f'Failed {failed} upload(s) still in progress after the timeout')
+            processed = process_queued_uploads(limit=options['limit'])
+            if processed:
+                self.stdout.write(f'Processed {processed} queued upload(s)')
+            if options['once']:
+                return
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from social_protection.json_indexes import sync_json_field_indexes
+
+
+class Command(BaseCommand):
+    help = 'Creates indexes on the beneficiaries Json_ext for the fields declared in benefit plan schemas ' \
+           'and drops indexes of fields not declared anymore. Requires PostgreSQL.'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('JSON field indexes require PostgreSQL.')
+        result = sync_json_field_indexes()
+        self.stdout.write(f'Created {len(result["created"])} index(es), dropped {len(result["dropped"])} index(es)')
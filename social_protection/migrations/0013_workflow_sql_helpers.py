@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Helpers used by the beneficiary update workflows. Changes of these definitions belong in new migrations,
+# so the workflows don't have to create them on every run.
+CREATE_HELPERS_SQL = """
+CREATE OR REPLACE FUNCTION filter_jsonb(data jsonb, schema jsonb)
+RETURNS jsonb AS $$
+  SELECT COALESCE(jsonb_object_agg(key, value), '{}'::jsonb)
+  FROM jsonb_each_text(data)
+  WHERE schema ? key
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+DO $$ BEGIN
+    CREATE TYPE failing_entry_beneficiary_upload AS (
+        uuids TEXT[],
+        ordinals INT[]
+    );
+EXCEPTION
+    WHEN duplicate_object THEN null;
+END $$;
+"""
+
+DROP_HELPERS_SQL = """
+DROP FUNCTION IF EXISTS filter_jsonb(jsonb, jsonb);
+DROP TYPE IF EXISTS failing_entry_beneficiary_upload;
+"""
+
+
+def _execute_on_postgresql(schema_editor, sql):
+    # The workflows relying on the helpers are PostgreSQL only
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(sql)
+
+
+def create_helpers(apps, schema_editor):
+    _execute_on_postgresql(schema_editor, CREATE_HELPERS_SQL)
+
+
+def drop_helpers(apps, schema_editor):
+    _execute_on_postgresql(schema_editor, DROP_HELPERS_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('social_protection', '0012_benefitplanmutation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_helpers, drop_helpers)
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_protection', '0013_workflow_sql_helpers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EligibilitySnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('POTENTIAL', 'POTENTIAL'), ('ACTIVE', 'ACTIVE'), ('GRADUATED', 'GRADUATED'), ('SUSPENDED', 'SUSPENDED')], max_length=100)),
+                ('criteria_hash', models.CharField(max_length=64)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('benefit_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eligibility_snapshots', to='social_protection.benefitplan')),
+            ],
+            options={
+                'unique_together': {('benefit_plan', 'status', 'criteria_hash')},
+            },
+        ),
+        migrations.CreateModel(
+            name='EligibilitySnapshotEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('beneficiary_id', models.UUIDField()),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='social_protection.eligibilitysnapshot')),
+            ],
+            options={
+                'unique_together': {('snapshot', 'beneficiary_id')},
+            },
+        ),
+    ]
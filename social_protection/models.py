@@ -85,3 +85,26 @@ class GroupBeneficiary(core_models.HistoryBusinessModel):
 class JSONUpdate(Func):
     function = 'JSONB_SET'
     arity = 3
+
+
+class EligibilitySnapshot(UUIDModel):
+    """
+    Beneficiaries of a benefit plan matching the advanced criteria of a status, evaluated once and reused by
+    the beneficiary queries until the beneficiaries of the plan or the criteria change.
+    """
+    benefit_plan = models.ForeignKey(BenefitPlan, models.CASCADE, related_name='eligibility_snapshots')
+    status = models.CharField(max_length=100, choices=BeneficiaryStatus.choices, null=False)
+    criteria_hash = models.CharField(max_length=64, null=False)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('benefit_plan', 'status', 'criteria_hash')
+
+
+class EligibilitySnapshotEntry(models.Model):
+    snapshot = models.ForeignKey(EligibilitySnapshot, models.CASCADE, related_name='entries')
+    # Id of Beneficiary or GroupBeneficiary, depending on the type of the benefit plan
+    beneficiary_id = models.UUIDField(null=False)
+
+    class Meta:
+        unique_together = ('snapshot', 'beneficiary_id')
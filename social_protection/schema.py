@@ -2,7 +2,7 @@ import graphene
 import pandas as pd
 
 from django.contrib.auth.models import AnonymousUser
-from django.db.models import Q, Case, When, BooleanField, Value
+from django.db.models import Q, BooleanField, Value, Exists
 from django.core.exceptions import PermissionDenied
 
 from django.utils.translation import gettext as _
@@ -25,9 +25,10 @@ from social_protection.gql_queries import (
     BenefitPlanGQLType,
     BeneficiaryGQLType, GroupBeneficiaryGQLType,
     BenefitPlanDataUploadQGLType, BenefitPlanSchemaFieldsGQLType,
-    BenefitPlanHistoryGQLType
+    BenefitPlanHistoryGQLType, annotate_has_payment_plans
 )
 from social_protection.export_mixin import ExportableSocialProtectionQueryMixin
+from social_protection.eligibility import get_eligible_subquery
 from social_protection.models import (
     BenefitPlan,
     Beneficiary, GroupBeneficiary, BenefitPlanDataUploadRecords
@@ -200,7 +201,7 @@ class Query(ExportableSocialProtectionQueryMixin, graphene.ObjectType):
             SocialProtectionConfig.gql_benefit_plan_search_perms
         )
 
-        query = BenefitPlan.objects.filter(*filters)
+        query = annotate_has_payment_plans(BenefitPlan.objects.filter(*filters))
 
         sort_alphabetically = kwargs.get("sort_alphabetically", None)
         if sort_alphabetically:
@@ -232,47 +233,32 @@ class Query(ExportableSocialProtectionQueryMixin, graphene.ObjectType):
                 )
             return query
 
-        def _get_eligible_uuids(query, info, **kwargs):
+        def _get_eligible_subquery(**kwargs):
             status = kwargs.get("status")
             benefit_plan_id = kwargs.get("benefit_plan__id")
-            default_results = (set(), False)  # No eligibility check was performed
 
             if not status or not benefit_plan_id:
-                return default_results
+                return None  # No eligibility check is performed
 
             benefit_plan = BenefitPlan.objects.filter(id=benefit_plan_id).first()
             if not benefit_plan:
-                return default_results
+                return None
 
             eligibility_filters = (benefit_plan.json_ext or {}).get('advanced_criteria', {}).get(status)
             if not eligibility_filters:
-                return default_results
+                return None
 
-            query_eligible = CustomFilterWizardStorage.build_custom_filters_queryset(
+            eligible_query = CustomFilterWizardStorage.build_custom_filters_queryset(
                 Query.module_name,
                 Query.object_type,
                 eligibility_filters,
-                query
-            )
-            eligible_beneficiaries = gql_optimizer.query(query_eligible, info)
-            eligible_uuids = set(eligible_beneficiaries.values_list('uuid', flat=True))
-            return eligible_uuids, True  # Eligibility check was performed
-
-        def _annotate_is_eligible(query, eligible_uuids, eligibility_check_performed):
-            return query.annotate(
-                is_eligible=Case(
-                    When(uuid__in=eligible_uuids, then=Value(True)),
-                    When(~Q(uuid__in=eligible_uuids) & Value(eligibility_check_performed), then=Value(False)),
-                    default=Value(None),
-                    output_field=BooleanField()
-                )
+                Beneficiary.objects.all()
             )
+            return get_eligible_subquery(benefit_plan, status, eligibility_filters, eligible_query)
 
         filters = _build_filters(info, **kwargs)
         query = _apply_custom_filters(Beneficiary.objects.filter(*filters), **kwargs)
-
-        eligible_uuids, eligibility_check_performed = _get_eligible_uuids(query, info, **kwargs)
-        query = _annotate_is_eligible(query, eligible_uuids, eligibility_check_performed)
+        query = Query._annotate_is_eligible(query, _get_eligible_subquery(**kwargs))
 
         return gql_optimizer.query(query, info)
 
@@ -302,48 +288,33 @@ class Query(ExportableSocialProtectionQueryMixin, graphene.ObjectType):
                 )
             return query
 
-        def _get_eligible_group_uuids(query, info, **kwargs):
+        def _get_eligible_group_subquery(**kwargs):
             status = kwargs.get("status")
             benefit_plan_id = kwargs.get("benefit_plan__id")
-            default_results = (set(), False)  # No eligibility check was performed
 
             if not status or not benefit_plan_id:
-                return default_results
+                return None  # No eligibility check is performed
 
             benefit_plan = BenefitPlan.objects.filter(id=benefit_plan_id).first()
             if not benefit_plan:
-                return default_results
+                return None
 
             eligibility_filters = (benefit_plan.json_ext or {}).get('advanced_criteria', {}).get(status)
             if not eligibility_filters:
-                return default_results
+                return None
 
-            query_eligible = CustomFilterWizardStorage.build_custom_filters_queryset(
+            eligible_query = CustomFilterWizardStorage.build_custom_filters_queryset(
                 Query.module_name,
                 Query.object_type,
                 eligibility_filters,
-                query,
+                GroupBeneficiary.objects.all(),
                 "group__groupindividual__individual",
             )
-            eligible_group_beneficiaries = gql_optimizer.query(query_eligible, info)
-            eligible_group_uuids = set(eligible_group_beneficiaries.values_list('uuid', flat=True))
-            return eligible_group_uuids, True  # Eligibility check was performed
-
-        def _annotate_is_eligible(query, eligible_group_uuids, eligibility_check_performed):
-            return query.annotate(
-                is_eligible=Case(
-                    When(uuid__in=eligible_group_uuids, then=Value(True)),
-                    When(~Q(uuid__in=eligible_group_uuids) & Value(eligibility_check_performed), then=Value(False)),
-                    default=Value(None),
-                    output_field=BooleanField()
-                )
-            )
+            return get_eligible_subquery(benefit_plan, status, eligibility_filters, eligible_query)
 
         filters = _build_filters(info, **kwargs)
         query = _apply_custom_filters(GroupBeneficiary.objects.filter(*filters), **kwargs)
-
-        eligible_group_uuids, eligibility_check_performed = _get_eligible_group_uuids(query, info, **kwargs)
-        query = _annotate_is_eligible(query, eligible_group_uuids, eligibility_check_performed)
+        query = Query._annotate_is_eligible(query, _get_eligible_group_subquery(**kwargs))
 
         return gql_optimizer.query(query, info)
 
@@ -391,6 +362,16 @@ class Query(ExportableSocialProtectionQueryMixin, graphene.ObjectType):
         query = BenefitPlan.objects.filter(*filters)
         return gql_optimizer.query(query, info)
 
+    @staticmethod
+    def _annotate_is_eligible(query, eligible_subquery):
+        """
+        is_eligible is None if no eligibility check is performed, otherwise it's computed in the database with
+        a subquery correlated to every row, so the eligible beneficiaries are never loaded.
+        """
+        if eligible_subquery is None:
+            return query.annotate(is_eligible=Value(None, output_field=BooleanField()))
+        return query.annotate(is_eligible=Exists(eligible_subquery))
+
     @staticmethod
     def _check_permissions(user, permission):
         if type(user) is AnonymousUser or not user.id or not user.has_perms(permission):
@@ -428,7 +409,7 @@ class Query(ExportableSocialProtectionQueryMixin, graphene.ObjectType):
             SocialProtectionConfig.gql_benefit_plan_search_perms
         )
 
-        query = BenefitPlan.history.filter(*filters)
+        query = annotate_has_payment_plans(BenefitPlan.history.filter(*filters))
 
         sort_alphabetically = kwargs.get("sort_alphabetically", None)
         if sort_alphabetically:
@@ -0,0 +1,69 @@
+"""
+Precompiled JSON schema validators of the benefit plans' beneficiary data schemas.
+
+Compiling a schema is done once per benefit plan version and the validator is kept for the lifetime of the process,
+so the rows of an upload are validated in Python in batches, instead of calling the ``validate_json_schema``
+database function for every row. Validators are dropped by ``BenefitPlanService`` when the plan is updated, the plan
+version is part of the cache key, so a validator of an outdated schema is not used even if the plan was changed
+by another process.
+"""
+import logging
+import threading
+from typing import Iterable, List
+
+from jsonschema.validators import Draft7Validator, validator_for
+
+from individual.models import IndividualDataSource
+from social_protection.apps import SocialProtectionConfig
+
+logger = logging.getLogger(__name__)
+
+_validators = {}
+_lock = threading.Lock()
+
+
+def is_python_schema_validation_enabled():
+    return bool(SocialProtectionConfig.enable_python_json_schema_validation)
+
+
+def get_compiled_validator(benefit_plan):
+    key = (str(benefit_plan.id), benefit_plan.version)
+    with _lock:
+        validator = _validators.get(key)
+        if validator is None:
+            schema = benefit_plan.beneficiary_data_schema or {}
+            validator_class = validator_for(schema, default=Draft7Validator)
+            validator = validator_class(schema)
+            # Only the current version of the plan is kept
+            _discard(key[0])
+            _validators[key] = validator
+        return validator
+
+
+def invalidate_benefit_plan_validators(benefit_plan_id):
+    with _lock:
+        _discard(str(benefit_plan_id))
+
+
+def _discard(benefit_plan_id: str):
+    for key in [key for key in _validators if key[0] == benefit_plan_id]:
+        del _validators[key]
+
+
+def find_invalid_data_sources(benefit_plan, upload_id, accepted: Iterable = None, batch_size: int = None) -> List[str]:
+    """
+    Validate pending rows of the upload against the benefit plan schema, rows are read from the database in batches.
+    Returns ids of the rows not matching the schema, with the same scope as the workflow SQL procedures: rows
+    without an individual, not deleted and, if given, in the accepted ids.
+    """
+    validator = get_compiled_validator(benefit_plan)
+    queryset = IndividualDataSource.objects.filter(upload_id=upload_id, individual__isnull=True, is_deleted=False)
+    if accepted is not None:
+        queryset = queryset.filter(id__in=accepted)
+    batch_size = batch_size or SocialProtectionConfig.beneficiary_import_chunk_size
+
+    invalid = []
+    for data_source_id, json_ext in queryset.values_list('id', 'json_ext').iterator(chunk_size=batch_size):
+        if not validator.is_valid(json_ext or {}):
+            invalid.append(str(data_source_id))
+    return invalid
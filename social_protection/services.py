@@ -1,32 +1,45 @@
 import copy
+import datetime
 import json
 import logging
+import threading
 import uuid
+from itertools import islice
 
-import concurrent.futures
-import math
 import pandas as pd
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.db import transaction
+from django.db import connection, transaction
 from django.db import models
-from django.db.models import Q, Value, Func, F
-from django.db.models.functions import Concat
+from django.db.models import Q, Value, Func, F, Exists, OuterRef
+from django.db.models.functions import Concat, Coalesce
 from pandas import DataFrame
+from simple_history.utils import bulk_create_with_history
 
 from calculation.services import get_calculation_object
 from core.services import BaseService
 from core.signals import register_service_signal
-from individual.models import IndividualDataSourceUpload, IndividualDataSource, Individual
+from individual.models import IndividualDataSourceUpload, IndividualDataSource, Individual, GroupIndividual
 from social_protection.apps import SocialProtectionConfig
+from social_protection.copy_ingestion import is_copy_ingestion_supported, copy_individual_data_sources
+from social_protection.eligibility import is_eligibility_snapshot_enabled, invalidate_eligibility_snapshots
+from social_protection.import_loaders import iter_csv_chunks, iter_xlsx_chunks, iter_excel_chunks, iter_ods_chunks
+from social_protection.json_indexes import schedule_json_field_index_sync
 from social_protection.models import (
     BenefitPlan,
     Beneficiary,
     BenefitPlanDataUploadRecords,
     GroupBeneficiary,
     BeneficiaryStatus,
+    JSONUpdate,
 )
 
-from social_protection.utils import load_dataframe, fetch_summary_of_valid_items, fetch_summary_of_broken_items
+from social_protection.utils import load_dataframe, fetch_summary_of_broken_items, dataframe_to_records, \
+    calculate_percentage_of_invalid_items, bulk_create_update_history
+from social_protection.schema_validators import invalidate_benefit_plan_validators
+from social_protection.uniqueness_index import BenefitPlanUniquenessIndex
+from social_protection.upload_metrics import upload_stage
+from social_protection.upload_queue import is_upload_queue_enabled, enqueue_upload_workflow
+from social_protection.validation_executors import get_validation_executor
 from social_protection.validation import (
     BeneficiaryValidation,
     BenefitPlanValidation, GroupBeneficiaryValidation
@@ -44,6 +57,16 @@ from social_protection.apps import SocialProtectionConfig
 logger = logging.getLogger(__name__)
 
 
+def _invalidate_eligibility_snapshots(model, obj_data):
+    if not is_eligibility_snapshot_enabled():
+        return
+    benefit_plan_id = obj_data.get('benefit_plan_id') or model.objects \
+        .filter(id=obj_data.get('id')) \
+        .values_list('benefit_plan_id', flat=True) \
+        .first()
+    invalidate_eligibility_snapshots(benefit_plan_id)
+
+
 class BenefitPlanService(BaseService, UpdateCheckerLogicServiceMixin):
     OBJECT_TYPE = BenefitPlan
 
@@ -52,15 +75,23 @@ class BenefitPlanService(BaseService, UpdateCheckerLogicServiceMixin):
 
     @register_service_signal('benefit_plan_service.create')
     def create(self, obj_data):
-        return super().create(obj_data)
+        result = super().create(obj_data)
+        schedule_json_field_index_sync()
+        return result
 
     @register_service_signal('benefit_plan_service.update')
     def update(self, obj_data):
-        return super().update(obj_data)
+        result = super().update(obj_data)
+        invalidate_benefit_plan_validators(obj_data.get('id'))
+        schedule_json_field_index_sync()
+        return result
 
     @register_service_signal('benefit_plan_service.delete')
     def delete(self, obj_data):
-        return super().delete(obj_data)
+        result = super().delete(obj_data)
+        invalidate_benefit_plan_validators(obj_data.get('id'))
+        schedule_json_field_index_sync()
+        return result
 
     @register_service_signal('benefit_plan_service.close')
     def close_benefit_plan(self, obj_data):
@@ -88,15 +119,21 @@ class BeneficiaryService(BaseService, CheckerLogicServiceMixin):
 
     @register_service_signal('beneficiary_service.create')
     def create(self, obj_data):
-        return super().create(obj_data)
+        result = super().create(obj_data)
+        _invalidate_eligibility_snapshots(self.OBJECT_TYPE, obj_data)
+        return result
 
     @register_service_signal('beneficiary_service.update')
     def update(self, obj_data):
-        return super().update(obj_data)
+        result = super().update(obj_data)
+        _invalidate_eligibility_snapshots(self.OBJECT_TYPE, obj_data)
+        return result
 
     @register_service_signal('beneficiary_service.delete')
     def delete(self, obj_data):
-        return super().delete(obj_data)
+        result = super().delete(obj_data)
+        _invalidate_eligibility_snapshots(self.OBJECT_TYPE, obj_data)
+        return result
 
     def _business_data_serializer(self, data):
         def serialize(key, value):
@@ -125,15 +162,21 @@ class GroupBeneficiaryService(BaseService, CheckerLogicServiceMixin):
 
     @register_service_signal('group_beneficiary_service.create')
     def create(self, obj_data):
-        return super().create(obj_data)
+        result = super().create(obj_data)
+        _invalidate_eligibility_snapshots(self.OBJECT_TYPE, obj_data)
+        return result
 
     @register_service_signal('group_beneficiary_service.update')
     def update(self, obj_data):
-        return super().update(obj_data)
+        result = super().update(obj_data)
+        _invalidate_eligibility_snapshots(self.OBJECT_TYPE, obj_data)
+        return result
 
     @register_service_signal('group_beneficiary_service.delete')
     def delete(self, obj_data):
-        return super().delete(obj_data)
+        result = super().delete(obj_data)
+        _invalidate_eligibility_snapshots(self.OBJECT_TYPE, obj_data)
+        return result
 
 
 class BeneficiaryImportService:
@@ -148,6 +191,17 @@ class BeneficiaryImportService:
         'application/vnd.oasis.opendocument.spreadsheet': lambda f: pd.read_excel(f),
     }
 
+    chunked_import_loaders = {
+        # .csv
+        'text/csv': iter_csv_chunks,
+        # .xlsx
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': iter_xlsx_chunks,
+        # .xls
+        'application/vnd.ms-excel': iter_excel_chunks,
+        # .ods
+        'application/vnd.oasis.opendocument.spreadsheet': iter_ods_chunks,
+    }
+
     def __init__(self, user):
         super().__init__()
         self.user = user
@@ -160,18 +214,40 @@ class BeneficiaryImportService:
                              group_aggregation_column: str):
         upload = self._save_sources(import_file)
         self._create_benefit_plan_data_upload_records(benefit_plan, workflow, upload, group_aggregation_column)
-        self._trigger_workflow(workflow, upload, benefit_plan)
+        if is_upload_queue_enabled():
+            enqueue_upload_workflow(upload, workflow, benefit_plan, self.user)
+        else:
+            self._trigger_workflow(workflow, upload, benefit_plan)
         return {'success': True, 'data': {'upload_uuid': upload.uuid}}
 
     @transaction.atomic
     def _save_sources(self, import_file):
         # Method separated as workflow execution must be independent of the atomic transaction.
         upload = self._create_upload_entry(import_file.name)
-        dataframe = self._load_import_file(import_file)
-        self._validate_dataframe(dataframe)
-        self._save_data_source(dataframe, upload)
+        if SocialProtectionConfig.enable_chunked_beneficiary_import:
+            # Chunks are loaded and saved alternately, both are measured as a single stage
+            with upload_stage(upload.id, 'save_data_source') as stage:
+                stage['rows'] = self._save_data_source_in_chunks(import_file, upload)
+        else:
+            with upload_stage(upload.id, 'load') as stage:
+                dataframe = self._load_import_file(import_file)
+                stage['rows'] = len(dataframe)
+            self._validate_dataframe(dataframe)
+            with upload_stage(upload.id, 'save_data_source', rows=len(dataframe)):
+                self._save_data_source(dataframe, upload)
+        # Stats are recorded with queryset updates, later saves of the upload must not overwrite them
+        upload.refresh_from_db(fields=['json_ext'])
         return upload
 
+    def _save_data_source_in_chunks(self, import_file, upload):
+        saved_rows = 0
+        for chunk in self._load_import_file_in_chunks(import_file):
+            self._save_data_source(chunk, upload)
+            saved_rows += len(chunk)
+        if not saved_rows:
+            raise ValueError("Import file is empty")
+        return saved_rows
+
     @transaction.atomic
     def _create_benefit_plan_data_upload_records(self, benefit_plan, workflow, upload, group_aggregation_column):
         record = BenefitPlanDataUploadRecords(
@@ -182,13 +258,19 @@ class BeneficiaryImportService:
         )
         record.save(username=self.user.username)
 
-    def validate_import_beneficiaries(self, upload_id: uuid, individual_sources, benefit_plan: BenefitPlan):
-        dataframe = self._load_dataframe(individual_sources)
-        validated_dataframe, invalid_items = self._validate_possible_beneficiaries(
-            dataframe,
-            benefit_plan,
-            upload_id
-        )
+    def validate_import_beneficiaries(self, upload_id: uuid, individual_sources, benefit_plan: BenefitPlan,
+                                      dataframe: DataFrame = None):
+        # Callers which already loaded the individual sources can pass them as dataframe to skip the reload
+        if dataframe is None:
+            with upload_stage(upload_id, 'load_data_source') as stage:
+                dataframe = self._load_dataframe(individual_sources)
+                stage['rows'] = len(dataframe)
+        with upload_stage(upload_id, 'validation', rows=len(dataframe)):
+            validated_dataframe, invalid_items = self._validate_possible_beneficiaries(
+                dataframe,
+                benefit_plan,
+                upload_id
+            )
         return {'success': True, 'data': validated_dataframe, 'summary_invalid_items': invalid_items}
 
     def create_task_with_importing_valid_items(self, upload_id: uuid, benefit_plan: BenefitPlan):
@@ -231,42 +313,70 @@ class BeneficiaryImportService:
             ).run_workflow()
 
     def synchronize_data_for_reporting(self, upload_id: uuid, benefit_plan: BenefitPlan):
-        self._synchronize_individual(upload_id)
-        self._synchronize_beneficiary(benefit_plan, upload_id)
+        with upload_stage(upload_id, 'synchronize_data_for_reporting') as stage:
+            synchronized = self._synchronize_data_for_reporting(upload_id, benefit_plan)
+            stage['rows'] = sum(synchronized.values())
+        # Synchronization runs at the end of every upload workflow, beneficiaries of the plan could be changed.
+        # Task completion handlers pass the benefit plan id instead of the benefit plan.
+        if is_eligibility_snapshot_enabled():
+            invalidate_eligibility_snapshots(getattr(benefit_plan, 'id', benefit_plan))
+        return synchronized
+
+    def _synchronize_data_for_reporting(self, upload_id, benefit_plan):
+        if SocialProtectionConfig.enable_bulk_reporting_synchronization:
+            synchronized = {
+                'individuals': self._bulk_synchronize(
+                    Individual.objects.filter(individualdatasource__upload=upload_id)
+                ),
+                'beneficiaries': self._bulk_synchronize(
+                    Beneficiary.objects.filter(
+                        benefit_plan=benefit_plan, individual__individualdatasource__upload_id=upload_id
+                    )
+                ),
+            }
+        else:
+            synchronized = {
+                'individuals': self._synchronize_individual(upload_id),
+                'beneficiaries': self._synchronize_beneficiary(benefit_plan, upload_id),
+            }
+        logger.info("Synchronized data for reporting of upload %s: %s", upload_id, synchronized)
+        return synchronized
 
-    def _validate_possible_beneficiaries(self, dataframe: DataFrame, benefit_plan: BenefitPlan, upload_id: uuid, num_workers=4):
+    def _validate_possible_beneficiaries(self, dataframe: DataFrame, benefit_plan: BenefitPlan, upload_id: uuid, num_workers=None):
         schema_dict = benefit_plan.beneficiary_data_schema
         properties = schema_dict.get("properties", {})
 
         calculation_uuid = SocialProtectionConfig.validation_calculation_uuid
         calculation = get_calculation_object(calculation_uuid)
 
-        unique_fields = [field for field, props in properties.items() if "uniqueness" in props]
-        unique_validations = {}
-        if unique_fields:
-            unique_validations = {
-                field: dataframe[field].duplicated(keep=False)
-                for field in unique_fields
-            }
+        unique_validations = BenefitPlanUniquenessIndex(benefit_plan).find_duplicates(dataframe)
+
+        executor = get_validation_executor(len(dataframe), num_workers)
+        data_chunks = executor.split(dataframe)
 
-        chunk_size = math.ceil(len(dataframe) / num_workers)
-        data_chunks = [dataframe[i:i + chunk_size] for i in range(0, dataframe.shape[0], chunk_size)]
+        column_validation = SocialProtectionConfig.enable_column_validation
+        chunk_processor = self.process_chunk_by_columns if column_validation else self.process_chunk
 
         validated_dataframe = []
-        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(
-                self.process_chunk,
-                chunk,
-                properties,
-                unique_validations,
-                calculation,
-                calculation_uuid
-            ) for chunk in data_chunks]
-
-            for future in concurrent.futures.as_completed(futures):
-                validated_dataframe.extend(future.result())
+        valid_ids = []
+        results = executor.map(
+            chunk_processor,
+            data_chunks,
+            properties,
+            unique_validations,
+            calculation,
+            calculation_uuid
+        )
+        for result in results:
+            if column_validation:
+                invalid_rows, chunk_valid_ids = result
+                validated_dataframe.extend(invalid_rows)
+                valid_ids.extend(chunk_valid_ids)
+            else:
+                validated_dataframe.extend(result)
 
         self.save_validation_error_in_data_source_bulk(validated_dataframe)
+        self._mark_data_sources_as_valid(valid_ids)
         invalid_items = fetch_summary_of_broken_items(upload_id)
         return validated_dataframe, invalid_items
 
@@ -289,25 +399,101 @@ class BeneficiaryImportService:
 
                 # Uniqueness Check
                 if "uniqueness" in field_properties and field in row:
-                    field_validation['validations'][f'{field}_uniqueness'] = not unique_validations[field].loc[row.name]
+                    field_validation['validations'][f'{field}_uniqueness'] = \
+                        BeneficiaryImportService._uniqueness_validation(
+                            field, row[field], unique_validations[field].loc[row.name]
+                        )
 
             validated_dataframe.append(field_validation)
 
         return validated_dataframe
 
-    def _handle_uniqueness(self, row, field, field_properties, benefit_plan, dataframe):
-        unique_class_validation = SocialProtectionConfig.unique_class_validation
-        calculation_uuid = SocialProtectionConfig.validation_calculation_uuid
-        calculation = get_calculation_object(calculation_uuid)
-        result_row = calculation.calculate_if_active_for_object(
-            unique_class_validation,
+    @staticmethod
+    def process_chunk_by_columns(chunk, properties, unique_validations, calculation, calculation_uuid):
+        """
+        Column oriented counterpart of process_chunk. Every validated field is evaluated for the whole chunk at once
+        and row entries are built only for the rows that failed at least one validation.
+        Returns a tuple of the invalid rows (in process_chunk format) and the ids of the valid rows.
+        """
+        failed_validations = {}
+        for field, field_properties in properties.items():
+            if field not in chunk.columns:
+                continue
+
+            # Validation Calculation
+            if "validationCalculation" in field_properties:
+                validation_name = field_properties["validationCalculation"]["name"]
+                failed_rows = BeneficiaryImportService._validate_column(
+                    chunk[field], validation_name, calculation, calculation_uuid
+                )
+                for row_index, result in failed_rows:
+                    failed_validations.setdefault(row_index, {})[field] = result
+
+            # Uniqueness Check
+            if "uniqueness" in field_properties:
+                duplicated = unique_validations[field].loc[chunk.index].to_numpy()
+                for row_index in chunk.index[duplicated]:
+                    failed_validations.setdefault(row_index, {})[f'{field}_uniqueness'] = \
+                        BeneficiaryImportService._uniqueness_validation(field, chunk.at[row_index, field], True)
+
+        invalid_rows = [
+            {'row': chunk.loc[row_index].to_dict(), 'validations': validations}
+            for row_index, validations in failed_validations.items()
+        ]
+        valid_ids = chunk.loc[~chunk.index.isin(list(failed_validations)), 'id'].tolist()
+        return invalid_rows, valid_ids
+
+    @staticmethod
+    def _uniqueness_validation(field, value, duplicated):
+        return {
+            'success': not duplicated,
+            'field_name': field,
+            'note': f"'{field}' Field value '{value}' is duplicated" if duplicated else None,
+            'duplications': None,
+        }
+
+    @staticmethod
+    def _validate_column(column, validation_name, calculation, calculation_uuid):
+        """
+        Returns (row index, validation result) pairs of the rows that failed the validation.
+
+        Calculations can evaluate a whole column through calculate_series_if_active_for_object, returning a tuple of
+        a boolean Series (True for valid values) and the notes for invalid values, either a single string or
+        a Series indexed like the column. Rules that don't support batch evaluation return None (or the calculation
+        doesn't provide the method at all) and are evaluated row by row with calculate_if_active_for_object.
+        """
+        field = column.name
+        batch_calculation = getattr(calculation, 'calculate_series_if_active_for_object', None)
+        batch_result = batch_calculation(
+            validation_name,
             calculation_uuid,
             field_name=field,
-            field_value=row[field],
-            benefit_plan=benefit_plan.id,
-            incoming_data=dataframe
-        )
-        return result_row
+            field_values=column
+        ) if batch_calculation else None
+
+        if batch_result is None:
+            results = (
+                (row_index, calculation.calculate_if_active_for_object(
+                    validation_name,
+                    calculation_uuid,
+                    field_name=field,
+                    field_value=value
+                ))
+                for row_index, value in column.items()
+            )
+            return [(row_index, result) for row_index, result in results if result and not result.get('success')]
+
+        valid_mask, notes = batch_result
+        invalid_index = column.index[~valid_mask.reindex(column.index, fill_value=False).to_numpy(dtype=bool)]
+        return [
+            (row_index, {
+                'success': False,
+                'field_name': field,
+                'note': notes if isinstance(notes, str) else notes.get(row_index),
+                'duplications': None,
+            })
+            for row_index in invalid_index
+        ]
 
     def _handle_validation_calculation(self, row, field, field_properties):
         validation_calculation = field_properties.get("validationCalculation", {}).get("name")
@@ -340,21 +526,44 @@ class BeneficiaryImportService:
 
         return self.import_loaders[import_file.content_type](import_file)
 
+    def _load_import_file_in_chunks(self, import_file):
+        if import_file.content_type not in self.chunked_import_loaders:
+            raise ValueError("Unsupported content type: {}".format(import_file.content_type))
+
+        chunk_size = SocialProtectionConfig.beneficiary_import_chunk_size
+        return self.chunked_import_loaders[import_file.content_type](import_file, chunk_size)
+
     def _save_data_source(self, dataframe: pd.DataFrame, upload: IndividualDataSourceUpload):
-        data_source_objects = []
+        records = dataframe_to_records(dataframe)
+        batch_size = SocialProtectionConfig.beneficiary_import_batch_size
 
-        for _, row in dataframe.iterrows():
-            ds = IndividualDataSource(
+        if self._use_copy_ingestion():
+            copy_individual_data_sources(records, upload, self.user, batch_size)
+            return
+
+        data_source_objects = [
+            IndividualDataSource(
                 upload=upload,
-                json_ext=json.loads(row.to_json()),
+                json_ext=record,
                 validations={},
                 user_created=self.user,
                 user_updated=self.user,
                 uuid=uuid.uuid4()
             )
-            data_source_objects.append(ds)
+            for record in records
+        ]
 
-        IndividualDataSource.objects.bulk_create(data_source_objects)
+        IndividualDataSource.objects.bulk_create(data_source_objects, batch_size=batch_size)
+
+    @staticmethod
+    def _use_copy_ingestion():
+        if SocialProtectionConfig.beneficiary_import_ingestion_backend != 'copy':
+            return False
+        if not is_copy_ingestion_supported():
+            logger.warning("COPY ingestion of beneficiary uploads is available only on PostgreSQL, "
+                           "falling back to the ORM.")
+            return False
+        return True
 
     def _save_row(self, row, upload):
         ds = IndividualDataSource(upload=upload, json_ext=json.loads(row.to_json()), validations={})
@@ -367,11 +576,16 @@ class BeneficiaryImportService:
                           workflow: WorkflowHandler,
                           upload: IndividualDataSourceUpload,
                           benefit_plan: BenefitPlan):
-        try:
-            # Before the run in order to avoid racing conditions
-            upload.status = IndividualDataSourceUpload.Status.TRIGGERED
-            upload.save(username=self.user.login_name)
+        # Before the run in order to avoid racing conditions
+        upload.status = IndividualDataSourceUpload.Status.TRIGGERED
+        upload.save(username=self.user.login_name)
+        return self.run_workflow(workflow, upload, benefit_plan)
 
+    def run_workflow(self,
+                     workflow: WorkflowHandler,
+                     upload: IndividualDataSourceUpload,
+                     benefit_plan: BenefitPlan):
+        try:
             result = workflow.run({
                 # Core user UUID required
                 'user_uuid': str(User.objects.get(username=self.user.login_name).id),
@@ -384,6 +598,7 @@ class BeneficiaryImportService:
             if result and isinstance(result, dict) and result.get('success') is False:
                 raise ValueError(result.get('message', 'Unexpected error during the workflow execution'))
         except ValueError as e:
+            upload.refresh_from_db(fields=['json_ext'])
             upload.status = IndividualDataSourceUpload.Status.FAIL
             upload.error = {'workflow': str(e)}
             upload.save(username=self.user.login_name)
@@ -413,6 +628,12 @@ class BeneficiaryImportService:
         if data_sources_to_update:
             IndividualDataSource.objects.bulk_update(data_sources_to_update, ['validations'])
 
+    def _mark_data_sources_as_valid(self, data_source_ids):
+        batch_size = SocialProtectionConfig.beneficiary_import_batch_size
+        for start in range(0, len(data_source_ids), batch_size):
+            IndividualDataSource.objects.filter(id__in=data_source_ids[start:start + batch_size]) \
+                .update(validations={'validation_errors': []})
+
     def _synchronize_individual(self, upload_id):
         individuals_to_update = Individual.objects.filter(
             individualdatasource__upload=upload_id
@@ -427,6 +648,7 @@ class BeneficiaryImportService:
             else:
                 individual.json_ext = synch_status
             individual.save(username=self.user.username)
+        return len(individuals_to_update)
 
     def _synchronize_beneficiary(self, benefit_plan, upload_id):
         unique_uuids = list((
@@ -448,6 +670,35 @@ class BeneficiaryImportService:
             else:
                 beneficiary.json_ext = synch_status
             beneficiary.save(username=self.user.username)
+        return len(beneficiaries)
+
+    def _bulk_synchronize(self, queryset):
+        """
+        Set-based counterpart of _synchronize_individual and _synchronize_beneficiary. Marks all rows of the queryset
+        as synchronized with a single UPDATE, history records are then written in batches.
+        Returns the number of updated rows.
+        """
+        objects = queryset.model.objects.filter(id__in=queryset.values('id'))
+        batch_size = SocialProtectionConfig.beneficiary_import_batch_size
+        with transaction.atomic():
+            updated = objects.update(
+                json_ext=JSONUpdate(
+                    JSONUpdate(
+                        Coalesce(F('json_ext'), Value({}, output_field=models.JSONField())),
+                        Value('{report_synch}'),
+                        Value('true', output_field=models.JSONField()),
+                        output_field=models.JSONField(),
+                    ),
+                    Value('{version}'),
+                    Func(F('version') + 1, function='TO_JSONB'),
+                    output_field=models.JSONField(),
+                ),
+                version=F('version') + 1,
+                date_updated=datetime.datetime.now(),
+                user_updated=self.user,
+            )
+            bulk_create_update_history(objects, self.user, batch_size)
+        return updated
 
 
 class BeneficiaryTaskCreatorService:
@@ -456,10 +707,12 @@ class BeneficiaryTaskCreatorService:
         self.user = user
 
     def create_task_with_importing_valid_items(self, upload_id: uuid, benefit_plan: BenefitPlan):
-        self._create_task(benefit_plan, upload_id, SocialProtectionConfig.validation_import_valid_items)
+        with upload_stage(upload_id, 'task_creation'):
+            self._create_task(benefit_plan, upload_id, SocialProtectionConfig.validation_import_valid_items)
 
     def create_task_with_update_valid_items(self, upload_id: uuid, benefit_plan: BenefitPlan):
-        self._create_task(benefit_plan, upload_id, SocialProtectionConfig.validation_upload_valid_items)
+        with upload_stage(upload_id, 'task_creation'):
+            self._create_task(benefit_plan, upload_id, SocialProtectionConfig.validation_upload_valid_items)
 
     @register_service_signal('socialProtection.update_task')
     @transaction.atomic()
@@ -477,7 +730,7 @@ class BeneficiaryTaskCreatorService:
             'benefit_plan_code': benefit_plan.code,
             'source_name': upload_record.data_upload.source_name,
             'workflow': upload_record.workflow,
-            'percentage_of_invalid_items': self.__calculate_percentage_of_invalid_items(upload_id),
+            'percentage_of_invalid_items': calculate_percentage_of_invalid_items(upload_id),
             'data_upload_id': str(upload_id)
         }
         TaskService(self.user).create({
@@ -493,15 +746,173 @@ class BeneficiaryTaskCreatorService:
         data_upload.status = IndividualDataSourceUpload.Status.WAITING_FOR_VERIFICATION
         data_upload.save(username=self.user.username)
 
-    def __calculate_percentage_of_invalid_items(self, upload_id):
-        number_of_valid_items = len(fetch_summary_of_valid_items(upload_id))
-        number_of_invalid_items = len(fetch_summary_of_broken_items(upload_id))
-        total_items = number_of_invalid_items + number_of_valid_items
 
-        if total_items == 0:
-            percentage_of_invalid_items = 0
-        else:
-            percentage_of_invalid_items = (number_of_invalid_items / total_items) * 100
+class BeneficiaryStatusTransitionService:
+    """
+    Moves all beneficiaries of a benefit plan to a status with chunked set-based updates. Progress of the transition
+    is stored in the benefit plan json_ext under 'status_transition'.
+    """
+    PROGRESS_KEY = 'status_transition'
+
+    def __init__(self, user):
+        self.user = user
+
+    def graduate(self, benefit_plan: BenefitPlan, asynchronous=False):
+        return self.transition(benefit_plan, BeneficiaryStatus.GRADUATED, asynchronous)
+
+    def transition(self, benefit_plan: BenefitPlan, status: BeneficiaryStatus, asynchronous=False):
+        """
+        Returns the number of updated beneficiaries. When run asynchronously, returns the thread that is started
+        once the current transaction is committed.
+        """
+        if asynchronous:
+            thread = threading.Thread(target=self._run_in_thread, args=(benefit_plan, status), daemon=True)
+            transaction.on_commit(thread.start)
+            return thread
+        return self._transition(benefit_plan, status)
+
+    def _run_in_thread(self, benefit_plan, status):
+        try:
+            self._transition(benefit_plan, status)
+        except Exception as exc:
+            logger.error("Error while changing status of benefit plan %s beneficiaries", benefit_plan.id, exc_info=exc)
+        finally:
+            connection.close()
+
+    def _transition(self, benefit_plan, status):
+        model = GroupBeneficiary if benefit_plan.type == BenefitPlan.BenefitPlanType.GROUP_TYPE else Beneficiary
+        pending = model.objects.filter(benefit_plan=benefit_plan, is_deleted=False).exclude(status=status)
+        batch_size = SocialProtectionConfig.beneficiary_status_transition_batch_size
+        progress = {'status': status, 'total': pending.count(), 'processed': 0, 'state': 'IN_PROGRESS'}
+        self._save_progress(benefit_plan, progress)
+        try:
+            while True:
+                with transaction.atomic():
+                    ids = list(pending.order_by('id').values_list('id', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    updated_objects = model.objects.filter(id__in=ids)
+                    updated_objects.update(
+                        status=status,
+                        version=F('version') + 1,
+                        date_updated=datetime.datetime.now(),
+                        user_updated=self.user,
+                    )
+                    bulk_create_update_history(updated_objects, self.user, batch_size)
+                progress['processed'] += len(ids)
+                self._save_progress(benefit_plan, progress)
+        except Exception:
+            self._save_progress(benefit_plan, {**progress, 'state': 'FAILED'})
+            raise
+        self._save_progress(benefit_plan, {**progress, 'state': 'COMPLETED'})
+        invalidate_eligibility_snapshots(benefit_plan.id)
+        return progress['processed']
+
+    def _save_progress(self, benefit_plan, progress):
+        # Queryset update, progress isn't a change of the benefit plan and shouldn't create a new version of it
+        BenefitPlan.objects.filter(id=benefit_plan.id).update(json_ext=JSONUpdate(
+            Coalesce(F('json_ext'), Value({}, output_field=models.JSONField())),
+            Value(f'{{{self.PROGRESS_KEY}}}'),
+            Value(progress, output_field=models.JSONField()),
+            output_field=models.JSONField(),
+        ))
+
+
+class BeneficiaryEnrollmentService:
+    """
+    Bulk enrollment of individuals and groups into benefit plans, beneficiaries are built in memory and inserted
+    in batches of enrollment_batch_size.
+    """
+
+    def __init__(self, user):
+        self.user = user
 
-        percentage_of_invalid_items = round(percentage_of_invalid_items, 2)
-        return percentage_of_invalid_items
+    def enroll_groups(self, group_ids, benefit_plan_id, status):
+        """
+        Enroll groups with the json_ext of their heads, heads of all groups are resolved with a single query.
+        Groups without a head are skipped. Returns the number of enrolled groups.
+        """
+        heads = GroupIndividual.objects.filter(
+            is_deleted=False,
+            group_id__in=group_ids,
+            role=GroupIndividual.Role.HEAD
+        )
+        return self._enroll_group_heads(heads, benefit_plan_id, status)
+
+    def enroll_groups_of_heads(self, head_individual_ids, benefit_plan_id, status):
+        """
+        Enroll groups headed by the given individuals, used when the heads were confirmed through an upload.
+        """
+        heads = GroupIndividual.objects.filter(
+            is_deleted=False,
+            individual_id__in=head_individual_ids,
+            role=GroupIndividual.Role.HEAD
+        )
+        return self._enroll_group_heads(heads, benefit_plan_id, status)
+
+    def enroll_individuals(self, individuals, benefit_plan_id, status):
+        """
+        Enroll individuals streamed in batches of enrollment_batch_size. Individuals already enrolled
+        into the benefit plan are excluded in the database with an anti-join and reported as skipped.
+        Returns a dict with inserted and skipped counts.
+        """
+        if not isinstance(individuals, models.QuerySet):
+            individuals = Individual.objects.filter(id__in=[individual.id for individual in individuals])
+        individuals = Individual.objects.filter(id__in=individuals.values('id'))
+        enrolled = Exists(Beneficiary.objects.filter(
+            individual_id=OuterRef('id'),
+            benefit_plan_id=benefit_plan_id,
+            is_deleted=False
+        ))
+        batch_size = SocialProtectionConfig.enrollment_batch_size
+        skipped = individuals.filter(enrolled).count()
+        inserted = 0
+        rows = individuals.exclude(enrolled).values_list('id', 'json_ext').iterator(chunk_size=batch_size)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            beneficiaries = [
+                Beneficiary(
+                    individual_id=individual_id,
+                    benefit_plan_id=benefit_plan_id,
+                    status=status,
+                    json_ext=json_ext,
+                    user_created=self.user,
+                    user_updated=self.user,
+                    uuid=uuid.uuid4(),
+                )
+                for individual_id, json_ext in batch
+            ]
+            bulk_create_with_history(beneficiaries, Beneficiary, batch_size=batch_size, default_user=self.user)
+            inserted += len(beneficiaries)
+        if inserted:
+            invalidate_eligibility_snapshots(benefit_plan_id)
+        return {'inserted': inserted, 'skipped': skipped}
+
+    def _enroll_group_heads(self, heads, benefit_plan_id, status):
+        head_json_ext_by_group = {}
+        for group_id, json_ext in heads.order_by('date_created').values_list('group_id', 'individual__json_ext'):
+            head_json_ext_by_group.setdefault(group_id, json_ext)
+
+        group_beneficiaries = [
+            GroupBeneficiary(
+                group_id=group_id,
+                benefit_plan_id=benefit_plan_id,
+                status=status,
+                json_ext=json_ext,
+                user_created=self.user,
+                user_updated=self.user,
+                uuid=uuid.uuid4(),
+            )
+            for group_id, json_ext in head_json_ext_by_group.items()
+        ]
+        bulk_create_with_history(
+            group_beneficiaries,
+            GroupBeneficiary,
+            batch_size=SocialProtectionConfig.enrollment_batch_size,
+            default_user=self.user
+        )
+        if group_beneficiaries:
+            invalidate_eligibility_snapshots(benefit_plan_id)
+        return len(group_beneficiaries)
@@ -10,9 +10,9 @@ from individual.models import (
 from social_protection.apps import SocialProtectionConfig
 from social_protection.models import (
     BenefitPlanDataUploadRecords,
-    BenefitPlan,
-    GroupBeneficiary
+    BenefitPlan
 )
+from social_protection.services import BeneficiaryEnrollmentService
 from social_protection.utils import calculate_percentage_of_invalid_items
 from tasks_management.models import Task
 from tasks_management.apps import TasksManagementConfig
@@ -53,7 +53,7 @@ def on_confirm_enrollment_of_group(**kwargs):
             is_deleted=False,
             group_id__in=group_ids,
             role=GroupIndividual.Role.HEAD
-        ).distinct()
+        ).select_related('individual').distinct()
         data_source_objects = []
         for group_individual in group_individuals:
             source = IndividualDataSource(
@@ -66,7 +66,9 @@ def on_confirm_enrollment_of_group(**kwargs):
                 uuid=uuid.uuid4(),
             )
             data_source_objects.append(source)
-        IndividualDataSource.objects.bulk_create(data_source_objects)
+        IndividualDataSource.objects.bulk_create(
+            data_source_objects, batch_size=SocialProtectionConfig.enrollment_batch_size
+        )
         json_ext = {
             'source_name': upload_record.data_upload.source_name,
             'workflow': upload_record.workflow,
@@ -84,19 +86,7 @@ def on_confirm_enrollment_of_group(**kwargs):
             'json_ext': json_ext
         })
     else:
-        for group in groups_to_upload:
-            head_group_individual = GroupIndividual.objects.filter(
-                is_deleted=False,
-                group=group,
-                role=GroupIndividual.Role.HEAD
-            ).first()
-            group_beneficiary = GroupBeneficiary(
-                group=group,
-                benefit_plan_id=benefit_plan_id,
-                status=status,
-                json_ext=head_group_individual.individual.json_ext
-            )
-            try:
-                group_beneficiary.save(username=user.username)
-            except ValidationError as e:
-                logger.error(f"Validation error occurred: {e}")
+        try:
+            BeneficiaryEnrollmentService(user).enroll_groups(group_ids, benefit_plan_id, status)
+        except ValidationError as e:
+            logger.error(f"Validation error occurred: {e}")
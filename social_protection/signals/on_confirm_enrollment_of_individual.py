@@ -8,10 +8,10 @@ from individual.models import (
 )
 from social_protection.apps import SocialProtectionConfig
 from social_protection.models import (
-    Beneficiary,
     BenefitPlanDataUploadRecords,
     BenefitPlan
 )
+from social_protection.services import BeneficiaryEnrollmentService
 from social_protection.utils import calculate_percentage_of_invalid_items
 from tasks_management.models import Task
 from tasks_management.apps import TasksManagementConfig
@@ -58,7 +58,9 @@ def on_confirm_enrollment_of_individual(**kwargs):
                 validations={}
             )
             data_source_objects.append(source)
-        IndividualDataSource.objects.bulk_create(data_source_objects)
+        IndividualDataSource.objects.bulk_create(
+            data_source_objects, batch_size=SocialProtectionConfig.enrollment_batch_size
+        )
         json_ext = {
             'source_name': upload_record.data_upload.source_name,
             'workflow': upload_record.workflow,
@@ -76,20 +78,10 @@ def on_confirm_enrollment_of_individual(**kwargs):
             'json_ext': json_ext
         })
     else:
-        new_beneficiaries = []
-        for individual in individuals_to_upload:
-            # Create a new Beneficiary instance
-            beneficiary = Beneficiary(
-                individual=individual,
-                benefit_plan_id=benefit_plan_id,
-                status=status,
-                json_ext=individual.json_ext,
-                user_created=user,
-                user_updated=user,
-                uuid=uuid.uuid4(),
-            )
-            new_beneficiaries.append(beneficiary)
         try:
-            Beneficiary.objects.bulk_create(new_beneficiaries)
+            result = BeneficiaryEnrollmentService(user).enroll_individuals(
+                individuals_to_upload, benefit_plan_id, status
+            )
+            logger.info("Enrollment into benefit plan %s: %s", benefit_plan_id, result)
         except ValidationError as e:
             logger.error(f"Validation error occurred: {e}")
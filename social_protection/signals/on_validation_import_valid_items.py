@@ -1,5 +1,4 @@
 import logging
-import uuid
 from django.core.exceptions import ValidationError
 from typing import List
 
@@ -7,14 +6,11 @@ from core.models import User
 from individual.models import (
     IndividualDataSourceUpload,
     IndividualDataSource,
-    Individual,
-    GroupIndividual
+    Individual
 )
 from social_protection.models import (
-    Beneficiary,
     BenefitPlanDataUploadRecords,
-    BenefitPlan,
-    GroupBeneficiary
+    BenefitPlan
 )
 from tasks_management.models import Task
 from workflow.services import WorkflowService
@@ -69,7 +65,7 @@ class ItemsUploadTaskCompletionEvent:
 
 def on_task_complete_action(business_event, **kwargs):
     from social_protection.apps import SocialProtectionConfig
-    from social_protection.services import BeneficiaryImportService
+    from social_protection.services import BeneficiaryImportService, BeneficiaryEnrollmentService
 
     result = kwargs.get('result')
     if not result or not result.get('success'):
@@ -98,20 +94,12 @@ def on_task_complete_action(business_event, **kwargs):
                 individualdatasource__upload_id=data['task']['json_ext']['data_upload_id']
             )
             user = User.objects.get(id=data['user']['id'])
-            new_beneficiaries = []
-            for individual in individuals_to_enroll:
-                beneficiary = Beneficiary(
-                    individual=individual,
-                    benefit_plan_id=data['task']['json_ext']['benefit_plan_id'],
-                    status=data['task']['json_ext']['beneficiary_status'],
-                    json_ext=individual.json_ext,
-                    user_created=user,
-                    user_updated=user,
-                    uuid=uuid.uuid4(),
-                )
-                new_beneficiaries.append(beneficiary)
             try:
-                Beneficiary.objects.bulk_create(new_beneficiaries)
+                BeneficiaryEnrollmentService(user).enroll_individuals(
+                    individuals_to_enroll,
+                    data['task']['json_ext']['benefit_plan_id'],
+                    data['task']['json_ext']['beneficiary_status']
+                )
                 BeneficiaryImportService(user).synchronize_data_for_reporting(
                     upload_id=data['task']['json_ext']['data_upload_id'],
                     benefit_plan=data['task']['json_ext']['benefit_plan_id']
@@ -122,23 +110,14 @@ def on_task_complete_action(business_event, **kwargs):
         elif business_event == SocialProtectionConfig.validation_group_enrollment:
             head_groups_to_enroll = Individual.objects.filter(
                 individualdatasource__upload_id=data['task']['json_ext']['data_upload_id']
-            )
+            ).values('id')
             user = User.objects.get(id=data['user']['id'])
-            new_group_beneficiaries = []
-            for head_individual in head_groups_to_enroll:
-                group_individual_head = GroupIndividual.objects.filter(individual=head_individual).first()
-                group_beneficiary = GroupBeneficiary(
-                    group=group_individual_head.group,
-                    benefit_plan_id=data['task']['json_ext']['benefit_plan_id'],
-                    status=data['task']['json_ext']['beneficiary_status'],
-                    json_ext=head_individual.json_ext,
-                    user_created=user,
-                    user_updated=user,
-                    uuid=uuid.uuid4(),
-                )
-                new_group_beneficiaries.append(group_beneficiary)
             try:
-                GroupBeneficiary.objects.bulk_create(new_group_beneficiaries)
+                BeneficiaryEnrollmentService(user).enroll_groups_of_heads(
+                    head_groups_to_enroll,
+                    data['task']['json_ext']['benefit_plan_id'],
+                    data['task']['json_ext']['beneficiary_status']
+                )
             except ValidationError as e:
                 logger.error(f"Validation error occurred: {e}")
             return
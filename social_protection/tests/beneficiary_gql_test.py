@@ -13,6 +13,8 @@ from social_protection.tests.test_helpers import create_benefit_plan,\
         create_individual, add_individual_to_benefit_plan
 from social_protection.services import BeneficiaryService
 import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 class BeneficiaryGQLTest(openIMISGraphQLTestCase):
     schema = Schema(query=sp_schema.Query)
@@ -346,3 +348,47 @@ class BeneficiaryGQLTest(openIMISGraphQLTestCase):
             e['node']['isEligible'] for e in beneficiary_data['edges']
         )
         self.assertTrue(all(eligible))
+
+    def test_query_beneficiary_is_eligible_annotation(self):
+        with CaptureQueriesContext(connection) as context:
+            eligibility = self._query_is_eligible(self.benefit_plan, 'POTENTIAL')
+        self.assertEqual(eligibility, {
+            self.individual_2child.first_name: True,
+            self.individual_1child.first_name: False,
+        })
+        # Eligibility is checked per row with a correlated subquery of the page query
+        page_queries = [query['sql'] for query in context.captured_queries
+                        if 'social_protection_beneficiary' in query['sql'] and 'EXISTS' in query['sql'].upper()]
+        self.assertTrue(page_queries)
+
+        # No eligibility check without status
+        eligibility = self._query_is_eligible(self.benefit_plan)
+        self.assertEqual(set(eligibility.values()), {None})
+
+        # No eligibility check for benefit plans without criteria of the status
+        benefit_plan = create_benefit_plan(self.user.username, payload_override={'code': 'SGQLNoCrit'})
+        benefit_plan.json_ext = {}
+        benefit_plan.save(username=self.user.username)
+        add_individual_to_benefit_plan(self.service, self.individual_not_enrolled, benefit_plan)
+        eligibility = self._query_is_eligible(benefit_plan, 'POTENTIAL')
+        self.assertEqual(eligibility, {self.individual_not_enrolled.first_name: None})
+
+    def _query_is_eligible(self, benefit_plan, status=None):
+        status_filter = f'status: {status},' if status else ''
+        response = self.query(f"""
+            query {{
+              beneficiary(benefitPlan_Id: "{benefit_plan.uuid}", {status_filter} isDeleted: false, first: 10) {{
+                edges {{
+                  node {{
+                    individual {{
+                      firstName
+                    }}
+                    isEligible
+                  }}
+                }}
+              }}
+            }}
+        """, headers={"HTTP_AUTHORIZATION": f"Bearer {self.user_token}"})
+        self.assertResponseNoErrors(response)
+        edges = json.loads(response.content)['data']['beneficiary']['edges']
+        return {edge['node']['individual']['firstName']: edge['node']['isEligible'] for edge in edges}
@@ -1,10 +1,27 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, DatabaseError, TransactionManagementError
 from django.test import TestCase
-from social_protection.models import BenefitPlan, BenefitPlanDataUploadRecords
+from social_protection.apps import SocialProtectionConfig
+from social_protection.models import BenefitPlan, BenefitPlanDataUploadRecords, Beneficiary, BeneficiaryStatus, \
+    EligibilitySnapshot
 from individual.models import IndividualDataSource, IndividualDataSourceUpload
 from social_protection.services import BeneficiaryImportService
+from social_protection.signals.on_validation_import_valid_items import on_task_complete_action
 from core.test_helpers import LogInHelper
 from social_protection.tests.data import service_add_payload
+from social_protection.utils import dataframe_to_records, fetch_upload_statistics, \
+    calculate_percentage_of_invalid_items, load_dataframe
+from social_protection.uniqueness_index import BenefitPlanUniquenessIndex
+from social_protection.upload_metrics import upload_stage
+from social_protection.upload_queue import enqueue_upload_workflow, process_queued_uploads, fail_stale_uploads
+from social_protection.workflows.utils import BatchedSqlProcedurePythonWorkflow
+from social_protection.validation_executors import get_validation_executor, InlineValidationExecutor, \
+    ThreadPoolValidationExecutor
 from individual.models import Individual
+from tasks_management.models import Task
 from individual.tests.data import service_add_individual_payload
 import pandas as pd
 
@@ -36,6 +53,18 @@ class BeneficiaryImportServiceTest(TestCase):
         )
         self.assertTrue(result.get('success', True))
 
+    def test_validate_import_beneficiaries_with_loaded_dataframe(self):
+        dataframe = self.service._load_dataframe(self.individual_sources)
+        with mock.patch.object(self.service, '_load_dataframe') as load_dataframe:
+            result = self.service.validate_import_beneficiaries(
+                self.upload.id,
+                self.individual_sources,
+                self.benefit_plan,
+                dataframe=dataframe
+            )
+        load_dataframe.assert_not_called()
+        self.assertTrue(result.get('success', True))
+
     def test_validate_possible_beneficiares(self):
         dataframe = self.service._load_dataframe(self.individual_sources)
         validated_dataframe, invalid_items = self.service._validate_possible_beneficiaries(
@@ -46,11 +75,378 @@ class BeneficiaryImportServiceTest(TestCase):
         self.assertIsInstance(validated_dataframe, list)
         self.assertIsInstance(invalid_items, list)
 
+    @mock.patch.object(SocialProtectionConfig, 'validation_executor', 'thread')
+    @mock.patch.object(SocialProtectionConfig, 'validation_inline_threshold', 10)
+    def test_get_validation_executor(self):
+        self.assertIsInstance(get_validation_executor(9), InlineValidationExecutor)
+        self.assertIsInstance(get_validation_executor(10, workers=1), InlineValidationExecutor)
+        executor = get_validation_executor(10, workers=3)
+        self.assertIsInstance(executor, ThreadPoolValidationExecutor)
+        self.assertEqual(len(executor.split(pd.DataFrame({'id': range(10)}))), 3)
+
+    @mock.patch.object(SocialProtectionConfig, 'validation_executor', 'thread')
+    @mock.patch.object(SocialProtectionConfig, 'validation_inline_threshold', 0)
+    def test_validate_possible_beneficiares_thread_executor(self):
+        dataframe = self.service._load_dataframe(self.individual_sources)
+        validated_dataframe, invalid_items = self.service._validate_possible_beneficiaries(
+            dataframe,
+            self.benefit_plan,
+            self.upload.id
+        )
+        self.assertEqual(len(validated_dataframe), len(dataframe))
+        self.assertIsInstance(invalid_items, list)
+
     def test_load_dataframe(self):
         result = self.service._load_dataframe(self.individual_sources)
         self.assertIsInstance(result, pd.DataFrame)
         self.assertEqual(result.size, len(self.individual_sources))
 
+    def test_load_dataframe_columns(self):
+        upload = self.__create_individual_data_source_upload()
+        for index in range(3):
+            data_source = IndividualDataSource(
+                upload=upload, validations={}, json_ext={'first_name': f'Name {index}', 'extra': index}
+            )
+            data_source.save(username=self.user.username)
+        sources = IndividualDataSource.objects.filter(upload=upload)
+
+        dataframe = load_dataframe(sources, columns=['first_name', 'missing'])
+        self.assertEqual(list(dataframe.columns), ['first_name', 'id'])
+        self.assertEqual(set(dataframe['id']), set(sources.values_list('id', flat=True)))
+
+    @mock.patch.object(SocialProtectionConfig, 'enable_chunked_beneficiary_import', True)
+    @mock.patch.object(SocialProtectionConfig, 'beneficiary_import_chunk_size', 2)
+    @mock.patch.object(SocialProtectionConfig, 'beneficiary_import_batch_size', 2)
+    def test_save_sources_in_chunks(self):
+        import_file = SimpleUploadedFile(
+            'beneficiaries.csv',
+            b'first_name,last_name,dob\nA,B,2000-01-01\nC,D,2000-01-02\nE,F,2000-01-03\n',
+            content_type='text/csv'
+        )
+        upload = self.service._save_sources(import_file)
+        sources = IndividualDataSource.objects.filter(upload_id=upload.id)
+        self.assertEqual(sources.count(), 3)
+        self.assertEqual(
+            sorted(sources.values_list('json_ext__first_name', flat=True)),
+            ['A', 'C', 'E']
+        )
+
+    @mock.patch.object(SocialProtectionConfig, 'enable_chunked_beneficiary_import', True)
+    def test_save_sources_in_chunks_empty_file(self):
+        import_file = SimpleUploadedFile('beneficiaries.csv', b'first_name,last_name,dob\n', content_type='text/csv')
+        with self.assertRaises(ValueError):
+            self.service._save_sources(import_file)
+
+    @mock.patch.object(SocialProtectionConfig, 'beneficiary_import_ingestion_backend', 'copy')
+    def test_save_data_source_copy_backend(self):
+        upload = self.__create_individual_data_source_upload()
+        dataframe = pd.DataFrame({'first_name': ['A', 'B'], 'last_name': ['C', 'D'], 'dob': ['2000-01-01', None]})
+        self.service._save_data_source(dataframe, upload)
+        sources = IndividualDataSource.objects.filter(upload_id=upload.id)
+        self.assertEqual(sources.count(), 2)
+        self.assertEqual(sources.filter(json_ext__dob=None).count(), 1)
+        self.assertTrue(all(source.validations == {} for source in sources))
+
+    def test_dataframe_to_records(self):
+        dataframe = pd.DataFrame({
+            'first_name': ['A', None],
+            'number_of_children': [1, None],
+            'dob': pd.to_datetime(['2000-01-01', None]),
+        })
+        self.assertEqual(dataframe_to_records(dataframe), [
+            {'first_name': 'A', 'number_of_children': 1.0, 'dob': '2000-01-01'},
+            {'first_name': None, 'number_of_children': None, 'dob': None},
+        ])
+
+    def test_process_chunk_by_columns(self):
+        chunk = pd.DataFrame({
+            'id': ['a', 'b', 'c'],
+            'email': ['john@example.com', 'invalid', 'john@example.com'],
+        })
+        properties = {'email': {'validationCalculation': {'name': 'EmailValidationStrategy'}, 'uniqueness': True}}
+        unique_validations = {'email': chunk['email'].duplicated(keep=False)}
+        calculation = mock.Mock(spec=['calculate_if_active_for_object'])
+        calculation.calculate_if_active_for_object.side_effect = lambda name, uuid, field_name, field_value: {
+            'success': '@' in field_value, 'field_name': field_name, 'note': 'Invalid email', 'duplications': None
+        }
+
+        invalid_rows, valid_ids = self.service.process_chunk_by_columns(
+            chunk, properties, unique_validations, calculation, 'calculation-uuid'
+        )
+
+        self.assertEqual(valid_ids, [])
+        invalid_by_id = {row['row']['id']: row['validations'] for row in invalid_rows}
+        self.assertEqual(set(invalid_by_id['a']), {'email_uniqueness'})
+        self.assertEqual(set(invalid_by_id['b']), {'email'})
+        self.assertEqual(invalid_by_id['b']['email']['note'], 'Invalid email')
+
+    def test_process_chunk_uniqueness_same_as_by_columns(self):
+        upload = self.__create_individual_data_source_upload()
+        source_ids = [str(source_id) for source_id in
+                      self.__create_individual_sources(upload).order_by('id').values_list('id', flat=True)]
+        chunk = pd.DataFrame({'id': source_ids, 'email': ['john@example.com', 'jane@example.com', 'john@example.com']})
+        properties = {'email': {'uniqueness': True}}
+        unique_validations = {'email': chunk['email'].duplicated(keep=False)}
+
+        rows = self.service.process_chunk(chunk, properties, unique_validations, None, 'calculation-uuid')
+        invalid_rows, valid_ids = self.service.process_chunk_by_columns(
+            chunk, properties, unique_validations, None, 'calculation-uuid'
+        )
+
+        row_results = {row['row']['id']: row['validations']['email_uniqueness'] for row in rows}
+        column_results = {row['row']['id']: row['validations']['email_uniqueness'] for row in invalid_rows}
+        self.assertEqual(valid_ids, [source_ids[1]])
+        self.assertTrue(row_results[source_ids[1]]['success'])
+        self.assertEqual({row_id: row_results[row_id] for row_id in column_results}, column_results)
+
+        # Row mode results are saved as validation errors of the duplicated rows
+        self.service.save_validation_error_in_data_source_bulk(rows)
+        errors = {str(source_id): validations for source_id, validations in
+                  IndividualDataSource.objects.filter(upload=upload).values_list('id', 'validations')}
+        self.assertEqual(errors[source_ids[0]]['validation_errors'][0]['field_name'], 'email')
+        self.assertEqual(errors[source_ids[1]]['validation_errors'], [])
+
+    def test_process_chunk_by_columns_batch_calculation(self):
+        chunk = pd.DataFrame({'id': ['a', 'b'], 'email': ['john@example.com', 'invalid']})
+        properties = {'email': {'validationCalculation': {'name': 'EmailValidationStrategy'}}}
+        calculation = mock.Mock()
+        calculation.calculate_series_if_active_for_object.side_effect = \
+            lambda name, uuid, field_name, field_values: (field_values.str.contains('@'), 'Invalid email')
+
+        invalid_rows, valid_ids = self.service.process_chunk_by_columns(
+            chunk, properties, {}, calculation, 'calculation-uuid'
+        )
+
+        self.assertEqual(valid_ids, ['a'])
+        self.assertEqual(len(invalid_rows), 1)
+        self.assertEqual(invalid_rows[0]['validations']['email']['note'], 'Invalid email')
+        calculation.calculate_if_active_for_object.assert_not_called()
+
+    def test_fetch_upload_statistics(self):
+        upload = self.__create_individual_data_source_upload()
+        for validations in ({'validation_errors': []}, {'validation_errors': []}, {'validation_errors': [{}]}):
+            data_source = IndividualDataSource(upload=upload, validations=validations, json_ext={})
+            data_source.save(username=self.user.username)
+        invalid_uuid = IndividualDataSource.objects.get(upload=upload, validations__validation_errors=[{}]).uuid
+
+        statistics = fetch_upload_statistics(upload.id, invalid_sample_size=5)
+
+        self.assertEqual(statistics['valid'], 2)
+        self.assertEqual(statistics['invalid'], 1)
+        self.assertEqual(statistics['total'], 3)
+        self.assertEqual(statistics['invalid_sample'], [invalid_uuid])
+        self.assertEqual(fetch_upload_statistics(upload.id)['invalid_sample'], [])
+        self.assertEqual(calculate_percentage_of_invalid_items(upload.id), 33.33)
+
+    @mock.patch.object(SocialProtectionConfig, 'enable_bulk_reporting_synchronization', True)
+    def test_synchronize_data_for_reporting_bulk(self):
+        individuals = Individual.objects.filter(individualdatasource__upload=self.upload)
+        versions = {individual.id: individual.version for individual in individuals}
+        history_count = Individual.history.count()
+
+        result = self.service.synchronize_data_for_reporting(self.upload.id, self.benefit_plan)
+
+        self.assertEqual(result, {'individuals': len(versions), 'beneficiaries': 0})
+        self.assertEqual(Individual.history.count(), history_count + len(versions))
+        for individual in Individual.objects.filter(id__in=versions):
+            self.assertEqual(individual.version, versions[individual.id] + 1)
+            self.assertEqual(individual.json_ext['report_synch'], 'true')
+            self.assertEqual(individual.json_ext['version'], individual.version)
+
+    @mock.patch.object(SocialProtectionConfig, 'beneficiary_upload_queue', 'database')
+    def test_upload_queue(self):
+        workflow = mock.Mock()
+        workflow.name, workflow.group = 'test-workflow', 'test-group'
+        workflow.run.return_value = {'success': True}
+        upload = self.__create_individual_data_source_upload()
+        failing_upload = self.__create_individual_data_source_upload()
+
+        enqueue_upload_workflow(upload, workflow, self.benefit_plan, self.user)
+        enqueue_upload_workflow(failing_upload, workflow, self.benefit_plan, self.user)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, IndividualDataSourceUpload.Status.TRIGGERED)
+        workflow.run.assert_not_called()
+
+        with mock.patch('social_protection.upload_queue._get_workflow', return_value=workflow) as get_workflow:
+            workflow.run.side_effect = [{'success': True}, {'success': False, 'message': 'Workflow failed'}]
+            self.assertEqual(process_queued_uploads(), 2)
+            self.assertEqual(process_queued_uploads(), 0)
+
+        get_workflow.assert_called_with('test-workflow', 'test-group')
+        self.assertEqual(workflow.run.call_args_list[0].args[0]['upload_uuid'], str(upload.uuid))
+        upload.refresh_from_db()
+        failing_upload.refresh_from_db()
+        # The final status is set by the workflow, not by the queue
+        self.assertEqual(upload.status, IndividualDataSourceUpload.Status.IN_PROGRESS)
+        self.assertEqual(failing_upload.status, IndividualDataSourceUpload.Status.FAIL)
+        self.assertEqual(failing_upload.error, {'workflow': 'Workflow failed'})
+
+        self.assertEqual(fail_stale_uploads(timeout=3600), 0)
+        IndividualDataSourceUpload.objects.filter(id=upload.id).update(
+            date_updated=upload.date_updated - timedelta(hours=2))
+        self.assertEqual(fail_stale_uploads(timeout=3600), 1)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, IndividualDataSourceUpload.Status.FAIL)
+
+    def test_upload_stage_metrics(self):
+        upload = self.__create_individual_data_source_upload()
+        hook = mock.Mock()
+
+        with mock.patch('social_protection.upload_metrics._metrics_hooks', [hook]):
+            with upload_stage(upload.id, 'load') as stage:
+                stage['rows'] = 10
+            with self.assertRaises(ValueError), upload_stage(upload.id, 'validation', rows=10):
+                raise ValueError('Invalid upload')
+
+        upload.refresh_from_db()
+        stats = upload.json_ext['stats']
+        self.assertEqual(set(stats), {'load', 'validation'})
+        self.assertEqual(stats['load']['rows'], 10)
+        self.assertTrue(stats['load']['success'])
+        self.assertFalse(stats['validation']['success'])
+        self.assertEqual(hook.call_count, 2)
+        hook.assert_any_call(str(upload.id), 'load', stats['load'])
+
+    def test_save_sources_failure_surfaces_original_error(self):
+        import_file = SimpleUploadedFile(
+            'beneficiaries.csv', b'first_name,last_name,dob\nA,B,2000-01-01\n', content_type='text/csv'
+        )
+        hook = mock.Mock()
+
+        def save_data_source(dataframe, upload):
+            # Failing query, the transaction of _save_sources is aborted before the stage is recorded
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT invalid_column FROM individual_individualdatasource')
+
+        with mock.patch('social_protection.upload_metrics._metrics_hooks', [hook]), \
+                mock.patch.object(self.service, '_save_data_source', side_effect=save_data_source), \
+                self.assertRaises(DatabaseError) as context:
+            self.service._save_sources(import_file)
+
+        self.assertNotIsInstance(context.exception, TransactionManagementError)
+        stage_calls = {call.args[1]: call.args[2] for call in hook.call_args_list}
+        self.assertFalse(stage_calls['save_data_source']['success'])
+
+    def test_batched_sql_procedure_checkpoint(self):
+        upload = self.__create_individual_data_source_upload()
+        data_source_ids = list(self.__create_individual_sources(upload).order_by('id').values_list('id', flat=True))
+        workflow = BatchedSqlProcedurePythonWorkflow(self.benefit_plan.uuid, upload.id, self.user.id, batch_size=2)
+        batch_sql = 'SELECT %(lower_bound)s, %(upper_bound)s'
+
+        # Resumed run skips validation and continues after the last committed batch
+        workflow._save_checkpoint({'last_id': str(data_source_ids[1]), 'batches': 1})
+        workflow.execute('SELECT invalid_column', batch_sql)
+        upload.refresh_from_db()
+        self.assertNotEqual(upload.status, IndividualDataSourceUpload.Status.FAIL)
+        checkpoint = upload.json_ext[BatchedSqlProcedurePythonWorkflow.CHECKPOINT_KEY]
+        self.assertEqual(checkpoint['batches'], 2)
+        self.assertTrue(checkpoint['finished'])
+
+        # Finished upload is processed again from the start
+        with mock.patch.object(workflow, '_save_checkpoint') as save_checkpoint:
+            workflow.execute('SELECT %(upload_id)s', batch_sql)
+        self.assertEqual([call.args[0]['last_id'] for call in save_checkpoint.call_args_list],
+                         [str(data_source_ids[1]), None])
+
+    def test_workflow_upload_summary(self):
+        upload = self.__create_individual_data_source_upload()
+        self.__create_individual_sources(upload)
+        with mock.patch('social_protection.workflows.utils.load_dataframe') as load_dataframe:
+            workflow = BatchedSqlProcedurePythonWorkflow(self.benefit_plan.uuid, upload.id, self.user.id)
+
+        # Headers and size are computed by the database, without loading the upload into a DataFrame
+        load_dataframe.assert_not_called()
+        self.assertEqual(workflow.row_count, 3)
+        expected_columns = {key for source in IndividualDataSource.objects.filter(upload=upload)
+                            for key in source.json_ext or {}}
+        self.assertEqual(workflow.columns, {*expected_columns, 'id'})
+
+    def test_batched_sql_procedure_failure_keeps_reported_errors(self):
+        upload = self.__create_individual_data_source_upload()
+        self.__create_individual_sources(upload)
+        reported_errors = {'error': 'Invalid entries', 'failing_entries_invalid_id': None}
+        IndividualDataSourceUpload.objects.filter(id=upload.id).update(error={'errors': reported_errors})
+        workflow = BatchedSqlProcedurePythonWorkflow(self.benefit_plan.uuid, upload.id, self.user.id, batch_size=2)
+
+        workflow.execute('SELECT %(upload_id)s', 'SELECT invalid_column')
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, IndividualDataSourceUpload.Status.FAIL)
+        self.assertEqual(upload.error['errors'], reported_errors)
+        self.assertIn('invalid_column', upload.error['workflow']['error'])
+
+    @mock.patch.object(SocialProtectionConfig, 'enable_eligibility_snapshots', True)
+    def test_enrollment_task_completion_with_benefit_plan_id(self):
+        upload = self.__create_individual_data_source_upload()
+        self.__create_individual_sources(upload)
+        upload_record = self.__create_benefit_plan_data_upload_records(upload, self.benefit_plan, 'test-workflow')
+        EligibilitySnapshot.objects.create(
+            benefit_plan=self.benefit_plan, status=BeneficiaryStatus.POTENTIAL, criteria_hash='test')
+
+        # Task completion passes the benefit plan id as a string, not the benefit plan
+        on_task_complete_action(SocialProtectionConfig.validation_enrollment, result={'success': True, 'data': {
+            'task': {
+                'business_event': SocialProtectionConfig.validation_enrollment,
+                'status': Task.Status.COMPLETED,
+                'entity_id': str(upload_record.id),
+                'json_ext': {
+                    'data_upload_id': str(upload.id),
+                    'benefit_plan_id': str(self.benefit_plan.id),
+                    'beneficiary_status': BeneficiaryStatus.POTENTIAL,
+                },
+            },
+            'user': {'id': str(self.user.id)},
+        }})
+
+        upload.refresh_from_db()
+        self.assertNotEqual(upload.status, IndividualDataSourceUpload.Status.FAIL)
+        self.assertEqual(Beneficiary.objects.filter(
+            benefit_plan=self.benefit_plan, individual__individualdatasource__upload=upload).count(), 3)
+        self.assertFalse(EligibilitySnapshot.objects.filter(benefit_plan=self.benefit_plan).exists())
+
+    def test_uniqueness_index_find_duplicates(self):
+        benefit_plan = BenefitPlan(**{
+            **service_add_payload,
+            'code': 'uniq',
+            'beneficiary_data_schema': {'properties': {'national_id': {'type': 'string', 'uniqueness': True}}},
+        })
+        benefit_plan.save(username=self.user.username)
+        beneficiary = Beneficiary(
+            individual=self.__create_individual(),
+            benefit_plan=benefit_plan,
+            status=BeneficiaryStatus.POTENTIAL,
+            json_ext={'national_id': 'N1'},
+        )
+        beneficiary.save(username=self.user.username)
+
+        index = BenefitPlanUniquenessIndex(benefit_plan)
+        dataframe = pd.DataFrame({'national_id': ['N1', 'N2', 'N3', 'N3']})
+        self.assertEqual(index.find_duplicates(dataframe)['national_id'].tolist(), [True, False, True, True])
+
+        # Updated beneficiary keeps its own value
+        dataframe['ID'] = [str(beneficiary.id), None, None, None]
+        self.assertEqual(index.find_duplicates(dataframe)['national_id'].tolist(), [False, False, True, True])
+
+    def test_uniqueness_index_boolean_field(self):
+        benefit_plan = BenefitPlan(**{
+            **service_add_payload,
+            'code': 'uniqbool',
+            'beneficiary_data_schema': {'properties': {'head': {'type': 'boolean', 'uniqueness': True}}},
+        })
+        benefit_plan.save(username=self.user.username)
+        Beneficiary(
+            individual=self.__create_individual(),
+            benefit_plan=benefit_plan,
+            status=BeneficiaryStatus.POTENTIAL,
+            json_ext={'head': True},
+        ).save(username=self.user.username)
+
+        # Boolean column values are numpy booleans, they have to match the 'true' extracted from Json_ext
+        dataframe = pd.DataFrame({'head': [True, False]})
+        self.assertEqual(dataframe['head'].dtype, bool)
+        index = BenefitPlanUniquenessIndex(benefit_plan)
+        self.assertEqual(index.find_duplicates(dataframe)['head'].tolist(), [True, False])
+
     def test_create_task_with_importing_valid_items(self):
         self.service.create_task_with_importing_valid_items(self.upload.id, self.benefit_plan)
 
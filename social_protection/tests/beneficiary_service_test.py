@@ -1,19 +1,25 @@
 import copy
+from unittest import mock
 
+from django.db.models import Exists
 from django.test import TestCase
 
 from individual.models import Individual
 from individual.tests.data import service_add_individual_payload
 
-from social_protection.models import Beneficiary, BenefitPlan
-from social_protection.services import BeneficiaryService
+from social_protection.apps import SocialProtectionConfig
+from social_protection.eligibility import get_eligible_subquery
+from social_protection.models import Beneficiary, BenefitPlan, BeneficiaryStatus, EligibilitySnapshot
+from social_protection.services import BeneficiaryService, BeneficiaryStatusTransitionService, \
+    BeneficiaryEnrollmentService
 from social_protection.tests.data import (
     service_add_payload,
     service_beneficiary_add_payload,
     service_beneficiary_update_payload
 )
 from core.test_helpers import LogInHelper
-from social_protection.tests.test_helpers import create_benefit_plan, create_individual
+from social_protection.tests.test_helpers import create_benefit_plan, create_individual, \
+    add_individual_to_benefit_plan
 
 
 class BeneficiaryServiceTest(TestCase):
@@ -69,3 +75,74 @@ class BeneficiaryServiceTest(TestCase):
         self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
         query = self.query_all.filter(uuid=uuid)
         self.assertEqual(query.count(), 0)
+
+    def test_graduate_beneficiaries(self):
+        benefit_plan = create_benefit_plan(self.user.username, payload_override={
+            'code': 'SGradTest',
+            'type': "INDIVIDUAL"
+        })
+        uuids = [
+            add_individual_to_benefit_plan(self.service, create_individual(self.user.username), benefit_plan)
+            for _ in range(3)
+        ]
+        graduated = Beneficiary.objects.get(id=uuids[0])
+        graduated.status = BeneficiaryStatus.GRADUATED
+        graduated.save(username=self.user.username)
+        history_count = Beneficiary.history.count()
+
+        result = BeneficiaryStatusTransitionService(self.user).graduate(benefit_plan)
+
+        self.assertEqual(result, 2)
+        self.assertEqual(
+            self.query_all.filter(id__in=uuids, status=BeneficiaryStatus.GRADUATED).count(), 3
+        )
+        self.assertEqual(Beneficiary.history.count(), history_count + 2)
+        progress = BenefitPlan.objects.get(id=benefit_plan.id).json_ext['status_transition']
+        self.assertEqual(progress['state'], 'COMPLETED')
+        self.assertEqual(progress['processed'], 2)
+        self.assertEqual(progress['total'], 2)
+
+    @mock.patch.object(SocialProtectionConfig, 'enrollment_batch_size', 2)
+    def test_enroll_individuals(self):
+        benefit_plan = create_benefit_plan(self.user.username, payload_override={
+            'code': 'SEnrollTest',
+            'type': "INDIVIDUAL"
+        })
+        individuals = [create_individual(self.user.username) for _ in range(3)]
+        add_individual_to_benefit_plan(self.service, individuals[0], benefit_plan)
+        enrollment_service = BeneficiaryEnrollmentService(self.user)
+        individuals_to_enroll = Individual.objects.filter(id__in=[individual.id for individual in individuals])
+
+        result = enrollment_service.enroll_individuals(individuals_to_enroll, benefit_plan.id, BeneficiaryStatus.ACTIVE)
+
+        self.assertEqual(result, {'inserted': 2, 'skipped': 1})
+        self.assertEqual(self.query_all.filter(benefit_plan=benefit_plan).count(), 3)
+        result = enrollment_service.enroll_individuals(individuals_to_enroll, benefit_plan.id, BeneficiaryStatus.ACTIVE)
+        self.assertEqual(result, {'inserted': 0, 'skipped': 3})
+
+    @mock.patch.object(SocialProtectionConfig, 'enable_eligibility_snapshots', True)
+    def test_eligibility_snapshot(self):
+        benefit_plan = create_benefit_plan(self.user.username, payload_override={'code': 'ELIGSNAP'})
+        result = self.service.create({**self.payload, "benefit_plan_id": benefit_plan.id})
+        self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
+        uuid = result.get('data', {}).get('uuid')
+        criteria = [{'custom_filter_condition': 'number_of_children__gte__integer=0'}]
+
+        eligible_subquery = get_eligible_subquery(benefit_plan, 'ACTIVE', criteria, Beneficiary.objects.all())
+        eligible = Beneficiary.objects.filter(benefit_plan=benefit_plan).annotate(is_eligible=Exists(eligible_subquery))
+        self.assertEqual(
+            [(str(beneficiary_uuid), is_eligible) for beneficiary_uuid, is_eligible in eligible.values_list('uuid', 'is_eligible')],
+            [(str(uuid), True)]
+        )
+        snapshots = EligibilitySnapshot.objects.filter(benefit_plan=benefit_plan)
+        self.assertEqual(snapshots.count(), 1)
+
+        # Snapshot is reused by the next queries and dropped when beneficiaries of the plan change
+        get_eligible_subquery(benefit_plan, 'ACTIVE', criteria, Beneficiary.objects.all())
+        self.assertEqual(snapshots.count(), 1)
+        update_payload = copy.deepcopy(service_beneficiary_update_payload)
+        update_payload['id'] = uuid
+        update_payload['individual_id'] = self.individual.id
+        update_payload['benefit_plan_id'] = benefit_plan.id
+        self.service.update(update_payload)
+        self.assertEqual(snapshots.count(), 0)
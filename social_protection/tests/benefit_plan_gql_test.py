@@ -0,0 +1,131 @@
+from unittest import mock
+import json
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from graphene import Schema
+from graphql_jwt.shortcuts import get_token
+
+from contribution_plan.models import PaymentPlan
+from core.models import User
+from core.models.openimis_graphql_test_case import openIMISGraphQLTestCase
+from core.test_helpers import create_test_interactive_user
+from individual.models import Individual, IndividualDataSourceUpload
+from social_protection import schema as sp_schema
+from social_protection.models import BenefitPlanDataUploadRecords
+from social_protection.tests.test_helpers import create_benefit_plan
+
+
+class BenefitPlanGQLTest(openIMISGraphQLTestCase):
+    schema = Schema(query=sp_schema.Query)
+
+    class BaseTestContext:
+        def __init__(self, user):
+            self.user = user
+
+    class AnonymousUserContext:
+        user = mock.Mock(is_anonymous=True)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.filter(username='admin', i_user__isnull=False).first()
+        if not cls.user:
+            cls.user = create_test_interactive_user(username='admin')
+        cls.user_token = get_token(cls.user, cls.BaseTestContext(user=cls.user))
+        cls.benefit_plans = [
+            create_benefit_plan(cls.user.username, payload_override={'code': f'GQLBP{i}', 'name': f'GQL BP {i}'})
+            for i in range(5)
+        ]
+
+    def test_query_benefit_plan_has_payment_plans_query_count(self):
+        query_str = """
+            query {
+              benefitPlan(code_Startswith: "GQLBP", first: 10) {
+                totalCount
+                edges {
+                  node {
+                    id
+                    hasPaymentPlans
+                  }
+                }
+              }
+            }
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(query_str, headers={"HTTP_AUTHORIZATION": f"Bearer {self.user_token}"})
+        self.assertResponseNoErrors(response)
+        response_data = json.loads(response.content)
+
+        edges = response_data['data']['benefitPlan']['edges']
+        self.assertEqual(len(edges), len(self.benefit_plans))
+        self.assertFalse(any(edge['node']['hasPaymentPlans'] for edge in edges))
+
+        if connection.vendor != 'postgresql':
+            return  # resolved per benefit plan on other databases
+        # has_payment_plans is computed with the page query, not with a query per benefit plan
+        payment_plan_queries = [
+            query for query in context.captured_queries if query['sql'].startswith('SELECT') and
+            'tblPaymentPlan' in query['sql'] and 'EXISTS' not in query['sql'].upper()
+        ]
+        self.assertEqual(payment_plan_queries, [])
+
+    def test_query_benefit_plan_has_payment_plans_of_benefit_plan_type(self):
+        benefit_plan, other_benefit_plan = self.benefit_plans[:2]
+        PaymentPlan(
+            code='GQLPP0', name='GQL PP 0', calculation=uuid.uuid4(), periodicity=1, json_ext={},
+            benefit_plan=benefit_plan
+        ).save(user=self.user)
+        # Same id stored for another entity type doesn't belong to the benefit plan
+        PaymentPlan(
+            code='GQLPP1', name='GQL PP 1', calculation=uuid.uuid4(), periodicity=1, json_ext={},
+            benefit_plan_id=str(other_benefit_plan.id), benefit_plan_type=ContentType.objects.get_for_model(Individual)
+        ).save(user=self.user)
+
+        response = self.query("""
+            query {
+              benefitPlan(code_Startswith: "GQLBP", first: 10) {
+                edges {
+                  node {
+                    code
+                    hasPaymentPlans
+                  }
+                }
+              }
+            }
+        """, headers={"HTTP_AUTHORIZATION": f"Bearer {self.user_token}"})
+        self.assertResponseNoErrors(response)
+        edges = json.loads(response.content)['data']['benefitPlan']['edges']
+        has_payment_plans = {edge['node']['code']: edge['node']['hasPaymentPlans'] for edge in edges}
+        self.assertTrue(has_payment_plans[benefit_plan.code])
+        self.assertFalse(has_payment_plans[other_benefit_plan.code])
+
+    def test_query_beneficiary_data_upload_history_stats(self):
+        stats = {'load': {'duration_seconds': 0.5, 'rows': 10, 'rows_per_second': 20.0, 'success': True}}
+        upload = IndividualDataSourceUpload(
+            source_name='stats.csv', source_type='beneficiary import', status=IndividualDataSourceUpload.Status.SUCCESS,
+            error={}, json_ext={'stats': stats}
+        )
+        upload.save(username=self.user.username)
+        BenefitPlanDataUploadRecords(
+            data_upload=upload, benefit_plan=self.benefit_plans[0], workflow='gql-stats-workflow'
+        ).save(username=self.user.username)
+
+        query_str = """
+            query {
+              beneficiaryDataUploadHistory(workflow: "gql-stats-workflow") {
+                edges {
+                  node {
+                    workflow
+                    stats
+                  }
+                }
+              }
+            }
+        """
+        response = self.query(query_str, headers={"HTTP_AUTHORIZATION": f"Bearer {self.user_token}"})
+        self.assertResponseNoErrors(response)
+        edges = json.loads(response.content)['data']['beneficiaryDataUploadHistory']['edges']
+        self.assertEqual([edge['node']['stats'] for edge in edges], [stats])
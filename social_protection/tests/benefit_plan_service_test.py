@@ -1,14 +1,19 @@
 import copy
+from unittest import mock
 
 from django.test import TestCase
 
+from social_protection import schema_validators
+from social_protection import json_indexes
+from social_protection.json_indexes import get_expected_indexes
 from social_protection.models import BenefitPlan
 from social_protection.services import BenefitPlanService
 from social_protection.tests.data import (
     service_add_payload,
     service_add_payload_no_ext,
     service_update_payload, service_add_payload_same_code, service_add_payload_same_name,
-    service_add_payload_invalid_schema
+    service_add_payload_invalid_schema,
+    service_add_payload_valid_schema
 )
 from core.test_helpers import LogInHelper
 
@@ -52,6 +57,22 @@ class BenefitPlanServiceTest(TestCase):
         self.assertEqual(query.count(), 1)
         self.assertEqual(query.first().name, update_payload.get('name'))
 
+    def test_update_benefit_plan_invalidates_schema_validator(self):
+        result = self.service.create(service_add_payload)
+        self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
+        uuid = result.get('data', {}).get('uuid')
+        benefit_plan = BenefitPlan.objects.get(id=uuid)
+        validator = schema_validators.get_compiled_validator(benefit_plan)
+        self.assertIs(schema_validators.get_compiled_validator(benefit_plan), validator)
+
+        update_payload = copy.deepcopy(service_update_payload)
+        update_payload['id'] = uuid
+        result = self.service.update(update_payload)
+        self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
+        self.assertFalse(any(key[0] == str(uuid) for key in schema_validators._validators))
+        benefit_plan.refresh_from_db()
+        self.assertIsNot(schema_validators.get_compiled_validator(benefit_plan), validator)
+
     def test_delete_benefit_plan(self):
         result = self.service.create(service_add_payload)
         self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
@@ -89,3 +110,45 @@ class BenefitPlanServiceTest(TestCase):
     def test_add_invalid_schema_benefit_plan(self):
         result = self.service.create(service_add_payload_invalid_schema)
         self.assertFalse(result.get('success', True))
+
+    def test_json_field_indexes_follow_schema(self):
+        result = self.service.create(service_add_payload_valid_schema)
+        self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
+        expressions = [expression for _, expression in get_expected_indexes().values()]
+        self.assertTrue(any("'email'" in expression and 'UPPER' in expression for expression in expressions))
+        self.assertTrue(any("'number_of_children'" in expression for expression in expressions))
+
+        self.service.delete({'id': result['data']['uuid']})
+        expressions = [expression for _, expression in get_expected_indexes().values()]
+        self.assertFalse(any("'number_of_children'" in expression for expression in expressions))
+
+    def test_json_field_indexes_of_group_plan(self):
+        result = self.service.create({
+            **service_add_payload_valid_schema, 'code': 'GRPIDX', 'name': 'Group indexes', 'type': 'GROUP'
+        })
+        self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
+        # Group custom filters read Json_ext of the individuals of the group
+        tables = {table for table, expression in get_expected_indexes().values() if "'number_of_children'" in expression}
+        self.assertEqual(tables, {'"individual_individual"'})
+
+    def test_json_field_indexes_rebuild_invalid(self):
+        expected = {
+            'sp_jx_valid': ('"t"', '("Json_ext" -> \'a\')'),
+            'sp_jx_invalid': ('"t"', '("Json_ext" -> \'b\')'),
+        }
+        existing = {'sp_jx_valid': True, 'sp_jx_invalid': False, 'sp_jx_removed': True}
+        with mock.patch.object(json_indexes, 'get_expected_indexes', return_value=expected), \
+                mock.patch.object(json_indexes, 'get_existing_indexes', return_value=existing), \
+                mock.patch.object(json_indexes, '_run_ddl') as run_ddl:
+            result = json_indexes.sync_json_field_indexes()
+
+        # Index left invalid by a failed concurrent build is dropped and created again
+        self.assertEqual(result, {'created': ['sp_jx_invalid'], 'dropped': ['sp_jx_invalid', 'sp_jx_removed']})
+        self.assertEqual(run_ddl.call_count, 3)
+
+    def test_json_field_indexes_background_sync_failure_is_logged(self):
+        with mock.patch.object(json_indexes, 'sync_json_field_indexes', side_effect=Exception('DDL failed')), \
+                mock.patch.object(json_indexes, 'connection') as connection, \
+                self.assertLogs(json_indexes.logger, level='ERROR'):
+            json_indexes._sync_in_background()
+        connection.close.assert_called_once()
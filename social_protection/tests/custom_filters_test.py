@@ -0,0 +1,120 @@
+import os
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from core.test_helpers import LogInHelper
+from social_protection.custom_filters import BenefitPlanCustomFilterWizard
+from social_protection.models import Beneficiary, GroupBeneficiary
+from social_protection.services import GroupBeneficiaryService
+from social_protection.tests.test_helpers import (
+    create_benefit_plan, create_group_with_individual, create_individual, add_individual_to_group,
+    add_group_to_benefit_plan,
+)
+
+# Number of synthetic beneficiaries used by the EXPLAIN test, run only with SOCIAL_PROTECTION_EXPLAIN_TESTS set
+EXPLAIN_TEST_ROWS = int(os.environ.get('SOCIAL_PROTECTION_EXPLAIN_TEST_ROWS', 1_000_000))
+
+
+class BenefitPlanCustomFilterWizardTest(TestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = LogInHelper().get_or_create_user_api()
+        cls.wizard = BenefitPlanCustomFilterWizard()
+        cls.benefit_plan = create_benefit_plan(cls.user.username, payload_override={'type': "GROUP"})
+        _, cls.group, _ = create_group_with_individual(cls.user.username, individual_override={
+            'json_ext': {'number_of_children': 2, 'able_bodied': True}
+        })
+        other_individual = create_individual(cls.user.username, payload_override={
+            'json_ext': {'number_of_children': 5, 'able_bodied': False}
+        })
+        add_individual_to_group(cls.user.username, other_individual, cls.group, is_head=False)
+        add_group_to_benefit_plan(GroupBeneficiaryService(cls.user), cls.group, cls.benefit_plan)
+        cls.query = GroupBeneficiary.objects.filter(benefit_plan=cls.benefit_plan)
+
+    def test_apply_filters_to_relation(self):
+        relation = 'group__groupindividual__individual'
+        query = self.wizard.apply_filter_to_queryset(
+            ['number_of_children__gte__integer=2', 'able_bodied__exact__boolean=True'], self.query, relation)
+        self.assertEqual(list(query.values_list('group_id', flat=True)), [self.group.id])
+
+        # All filters have to match the same related individual
+        query = self.wizard.apply_filter_to_queryset(
+            ['number_of_children__gte__integer=3', 'able_bodied__exact__boolean=True'], self.query, relation)
+        self.assertFalse(query.exists())
+
+        # Group matched by both individuals is returned once, without DISTINCT
+        query = self.wizard.apply_filter_to_queryset(['number_of_children__gte__integer=1'], self.query, relation)
+        self.assertEqual(query.count(), 1)
+        sql = str(query.query).upper()
+        self.assertEqual(sql.count('EXISTS'), 1)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_apply_filters_without_relation(self):
+        query = self.wizard.apply_filter_to_queryset([
+            {'field': 'number_of_children', 'filter': 'gte', 'type': 'integer', 'value': '5'}
+        ], self.query)
+        self.assertFalse(query.exists())
+        self.assertNotIn('EXISTS', str(query.query).upper())
+
+
+@skipUnless(
+    os.environ.get('SOCIAL_PROTECTION_EXPLAIN_TESTS') and connection.vendor == 'postgresql',
+    'EXPLAIN tests on a large synthetic dataset are run only on PostgreSQL with SOCIAL_PROTECTION_EXPLAIN_TESTS set'
+)
+class BenefitPlanCustomFilterWizardExplainTest(TestCase):
+    filters = ['number_of_children__gte__integer=3', 'able_bodied__exact__boolean=True']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = LogInHelper().get_or_create_user_api()
+        cls.wizard = BenefitPlanCustomFilterWizard()
+        cls.benefit_plan = create_benefit_plan(cls.user.username)
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                WITH new_individual AS (
+                    INSERT INTO individual_individual(
+                        "UUID", "isDeleted", version, "UserCreatedUUID", "UserUpdatedUUID",
+                        "Json_ext", first_name, last_name, dob
+                    )
+                    SELECT gen_random_uuid(), false, 1, %(user_id)s, %(user_id)s,
+                           jsonb_build_object('number_of_children', i %% 7, 'able_bodied', i %% 3 = 0),
+                           'First' || i, 'Last' || i, DATE '1990-01-01'
+                    FROM generate_series(1, %(rows)s) AS i
+                    RETURNING "UUID", "Json_ext"
+                )
+                INSERT INTO social_protection_beneficiary(
+                    "UUID", "isDeleted", "Json_ext", "DateCreated", "DateUpdated", version, "DateValidFrom",
+                    status, benefit_plan_id, individual_id, "UserCreatedUUID", "UserUpdatedUUID"
+                )
+                SELECT gen_random_uuid(), false, '{}'::jsonb, NOW(), NOW(), 1, NOW(),
+                       'POTENTIAL', %(benefit_plan_id)s, "UUID", %(user_id)s, %(user_id)s
+                FROM new_individual
+            """, {'user_id': cls.user.id, 'benefit_plan_id': cls.benefit_plan.id, 'rows': EXPLAIN_TEST_ROWS})
+            cursor.execute('ANALYZE individual_individual')
+            cursor.execute('ANALYZE social_protection_beneficiary')
+        cls.query = Beneficiary.objects.filter(benefit_plan=cls.benefit_plan)
+
+    def test_filters_plan_single_join_without_distinct(self):
+        plan = self.wizard.apply_filter_to_queryset(self.filters, self.query, 'individual').explain()
+        self.assertEqual(plan.count('individual_individual'), 1, plan)
+        self.assertNotIn('Unique', plan)
+        self.assertNotIn('HashAggregate', plan)
+
+    def test_chained_filters_plan_for_comparison(self):
+        # Previous implementation, every filter chained with distinct() on the related path
+        query = self.query
+        for field, value in (('number_of_children__gte', 3), ('able_bodied__exact', True)):
+            query = query.filter(**{f'individual__json_ext__{field}': value}).distinct()
+        plan = query.explain()
+        self.assertTrue('Unique' in plan or 'HashAggregate' in plan, plan)
+
+    def test_filters_result(self):
+        query = self.wizard.apply_filter_to_queryset(self.filters, self.query, 'individual')
+        expected = sum(1 for i in range(1, EXPLAIN_TEST_ROWS + 1) if i % 7 >= 3 and i % 3 == 0)
+        self.assertEqual(query.count(), expected)
@@ -13,6 +13,8 @@ from social_protection.tests.test_helpers import create_benefit_plan,\
         create_group_with_individual, add_group_to_benefit_plan, create_individual, add_individual_to_group
 from social_protection.services import GroupBeneficiaryService
 import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 class GroupBeneficiaryGQLTest(openIMISGraphQLTestCase):
     schema = Schema(query=sp_schema.Query)
@@ -326,3 +328,47 @@ class GroupBeneficiaryGQLTest(openIMISGraphQLTestCase):
         eligible_beneficiary = beneficiary_data['edges'][0]['node']
         self.assertFalse(eligible_beneficiary['isEligible'])
         self.assertEqual(self.group_1child.code, eligible_beneficiary['group']['code'])
+
+    def test_query_group_beneficiary_is_eligible_annotation(self):
+        with CaptureQueriesContext(connection) as context:
+            eligibility = self._query_is_eligible(self.benefit_plan, 'POTENTIAL')
+        # Criteria are checked on the individuals of the group, through group__groupindividual__individual
+        self.assertEqual(eligibility, {
+            self.group_2child.code: True,
+            self.group_1child.code: False,
+        })
+        page_queries = [query['sql'] for query in context.captured_queries
+                        if 'social_protection_groupbeneficiary' in query['sql'] and 'EXISTS' in query['sql'].upper()]
+        self.assertTrue(page_queries)
+
+        # No eligibility check without status
+        eligibility = self._query_is_eligible(self.benefit_plan)
+        self.assertEqual(set(eligibility.values()), {None})
+
+        # No eligibility check for benefit plans without criteria of the status
+        benefit_plan = create_benefit_plan(self.user.username, payload_override={'code': 'GGQLNoCrit', 'type': 'GROUP'})
+        benefit_plan.json_ext = {}
+        benefit_plan.save(username=self.user.username)
+        add_group_to_benefit_plan(self.service, self.group_not_enrolled, benefit_plan)
+        eligibility = self._query_is_eligible(benefit_plan, 'POTENTIAL')
+        self.assertEqual(eligibility, {self.group_not_enrolled.code: None})
+
+    def _query_is_eligible(self, benefit_plan, status=None):
+        status_filter = f'status: {status},' if status else ''
+        response = self.query(f"""
+            query {{
+              groupBeneficiary(benefitPlan_Id: "{benefit_plan.uuid}", {status_filter} isDeleted: false, first: 10) {{
+                edges {{
+                  node {{
+                    group {{
+                      code
+                    }}
+                    isEligible
+                  }}
+                }}
+              }}
+            }}
+        """, headers={"HTTP_AUTHORIZATION": f"Bearer {self.user_token}"})
+        self.assertResponseNoErrors(response)
+        edges = json.loads(response.content)['data']['groupBeneficiary']['edges']
+        return {edge['node']['group']['code']: edge['node']['isEligible'] for edge in edges}
@@ -4,14 +4,14 @@ from django.test import TestCase
 
 from individual.models import Group
 
-from social_protection.models import BenefitPlan, GroupBeneficiary
-from social_protection.services import GroupBeneficiaryService
+from social_protection.models import BenefitPlan, GroupBeneficiary, BeneficiaryStatus
+from social_protection.services import GroupBeneficiaryService, BeneficiaryEnrollmentService
 from social_protection.tests.data import (
     service_beneficiary_add_payload, service_beneficiary_update_payload,
 )
 from core.test_helpers import LogInHelper
 from social_protection.tests.test_helpers import (
-    create_benefit_plan, create_group
+    create_benefit_plan, create_group, create_group_with_individual
 )
 from datetime import datetime
 
@@ -68,3 +68,23 @@ class GroupBeneficiaryServiceTest(TestCase):
         self.assertTrue(result.get('success', False), result.get('detail', "No details provided"))
         query = self.query_all.filter(uuid=uuid)
         self.assertEqual(query.count(), 0)
+
+    def test_enroll_groups(self):
+        benefit_plan = create_benefit_plan(self.user.username, payload_override={
+            'code': 'GEnrollTest',
+            'type': "GROUP"
+        })
+        heads, groups = zip(*[create_group_with_individual(self.user.username)[:2] for _ in range(3)])
+        group_without_head = create_group(self.user.username)
+        group_ids = [group.id for group in groups] + [group_without_head.id]
+
+        enrolled = BeneficiaryEnrollmentService(self.user).enroll_groups(
+            group_ids, benefit_plan.id, BeneficiaryStatus.ACTIVE
+        )
+
+        self.assertEqual(enrolled, 3)
+        group_beneficiaries = self.query_all.filter(benefit_plan=benefit_plan)
+        self.assertEqual(set(group_beneficiaries.values_list('group_id', flat=True)), {group.id for group in groups})
+        for head, group in zip(heads, groups):
+            self.assertEqual(group_beneficiaries.get(group=group).json_ext, head.json_ext)
+        self.assertEqual(GroupBeneficiary.history.filter(benefit_plan_id=benefit_plan.id).count(), 3)
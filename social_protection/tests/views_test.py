@@ -0,0 +1,71 @@
+import csv
+import io
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.test_helpers import LogInHelper
+from individual.models import IndividualDataSource, IndividualDataSourceUpload
+from social_protection.models import BenefitPlanDataUploadRecords
+from social_protection.tests.test_helpers import create_benefit_plan
+from social_protection.views import download_invalid_items
+
+
+class DownloadInvalidItemsViewTest(TestCase):
+    schema_columns = ['first_name', 'last_name', 'dob', 'email', 'able_bodied', 'number_of_children']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = LogInHelper().get_or_create_user_api()
+        cls.benefit_plan = create_benefit_plan(cls.user.username, payload_override={'code': 'INVDL'})
+
+    def test_download_invalid_items(self):
+        upload = self._create_upload()
+        errors = {'validation_errors': [{'field_name': 'email', 'note': 'Invalid email'}]}
+        invalid_sources = [
+            self._create_data_source(upload, {'first_name': 'A', 'email': 'a'}, errors),
+            self._create_data_source(upload, {'first_name': 'B', 'email': 'b', 'extra_key': 'x'}, errors),
+            self._create_data_source(upload, {'first_name': 'C', 'email': 'c'}, errors),
+        ]
+        self._create_data_source(upload, {'first_name': 'Valid', 'email': 'valid@example.com'},
+                                 {'validation_errors': []})
+
+        header, *rows = self._download(upload)
+
+        # Schema fields followed by the other uploaded keys
+        self.assertEqual(header, ['id', *self.schema_columns, 'extra_key', 'error'])
+        self.assertEqual([row[0] for row in rows], [str(source.id) for source in invalid_sources])
+        row_b = dict(zip(header, rows[1]))
+        self.assertEqual(row_b['first_name'], 'B')
+        self.assertEqual(row_b['extra_key'], 'x')
+        self.assertIn('Invalid email', row_b['error'])
+
+    def test_download_invalid_items_empty_upload(self):
+        upload = self._create_upload()
+
+        self.assertEqual(self._download(upload), [['id', *self.schema_columns, 'error']])
+
+    def _download(self, upload):
+        request = APIRequestFactory().get('/download_invalid_items/', {'upload_id': str(upload.id)})
+        force_authenticate(request, user=self.user)
+        response = download_invalid_items(request)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.reader(io.StringIO(content)))
+
+    def _create_upload(self):
+        upload = IndividualDataSourceUpload(
+            source_name='invalid.csv', source_type='beneficiary import',
+            status=IndividualDataSourceUpload.Status.PARTIAL_SUCCESS, error={}, json_ext={}
+        )
+        upload.save(username=self.user.username)
+        BenefitPlanDataUploadRecords(
+            data_upload=upload, benefit_plan=self.benefit_plan, workflow='test-workflow'
+        ).save(username=self.user.username)
+        return upload
+
+    def _create_data_source(self, upload, json_ext, validations):
+        data_source = IndividualDataSource(upload=upload, json_ext=json_ext, validations=validations)
+        data_source.save(username=self.user.username)
+        return data_source
@@ -0,0 +1,94 @@
+"""
+Index of the values of the benefit plan schema fields marked with ``uniqueness``.
+
+Values stored for the beneficiaries of the plan are loaded with a single query into hashed maps, so every uploaded
+row is checked in constant time, both against the other rows of the upload and against the existing beneficiaries.
+"""
+import math
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from django.db.models.fields.json import KeyTextTransform
+from pandas import DataFrame, Series
+
+from social_protection.apps import SocialProtectionConfig
+from social_protection.models import BenefitPlan, Beneficiary
+
+# Marks values shared by more than one beneficiary, such a value is a duplicate for every uploaded row
+_SHARED_VALUE = ''
+
+
+class BenefitPlanUniquenessIndex:
+    def __init__(self, benefit_plan: BenefitPlan, fields: List[str] = None):
+        self.benefit_plan = benefit_plan
+        self.fields = fields if fields is not None else self.get_unique_fields(benefit_plan)
+        self._existing_values = None
+
+    @staticmethod
+    def get_unique_fields(benefit_plan: BenefitPlan) -> List[str]:
+        properties = (benefit_plan.beneficiary_data_schema or {}).get("properties", {})
+        return [field for field, props in properties.items() if "uniqueness" in props]
+
+    @property
+    def existing_values(self) -> Dict[str, Dict[str, str]]:
+        """
+        For every unique field, maps values stored for the plan to the id of the beneficiary having the value.
+        """
+        if self._existing_values is None:
+            self._existing_values = self._load_existing_values()
+        return self._existing_values
+
+    def find_duplicates(self, dataframe: DataFrame) -> Dict[str, Series]:
+        """
+        Returns, for every unique field present in the dataframe, a boolean Series indexed like the dataframe, True
+        for values duplicated in the dataframe or already used by another beneficiary of the plan. For update
+        uploads the 'ID' column identifies the updated beneficiary, whose own stored values are not duplicates.
+        """
+        beneficiary_ids = dataframe['ID'].map(_normalize) if 'ID' in dataframe.columns else None
+        duplicates = {}
+        for field in self.fields:
+            if field not in dataframe.columns:
+                continue
+            column = dataframe[field].map(_normalize)
+            stored_by = column.map(self.existing_values[field])
+            in_database = stored_by.notna()
+            if beneficiary_ids is not None:
+                in_database &= stored_by != beneficiary_ids
+            duplicates[field] = column.duplicated(keep=False) | in_database
+        return duplicates
+
+    def _load_existing_values(self):
+        existing_values = {field: {} for field in self.fields}
+        if not self.fields:
+            return existing_values
+        annotations = {f'unique_{i}': KeyTextTransform(field, 'json_ext') for i, field in enumerate(self.fields)}
+        rows = Beneficiary.objects \
+            .filter(benefit_plan=self.benefit_plan, is_deleted=False) \
+            .annotate(**annotations) \
+            .values_list('id', *annotations) \
+            .iterator(chunk_size=SocialProtectionConfig.beneficiary_import_chunk_size)
+        for beneficiary_id, *values in rows:
+            for field, value in zip(self.fields, values):
+                if value is None:
+                    continue
+                field_values = existing_values[field]
+                field_values[value] = _SHARED_VALUE if value in field_values else str(beneficiary_id)
+        return existing_values
+
+
+def _normalize(value):
+    """
+    Text representation of the value, as extracted from the JSON field by the database, None for missing values.
+    """
+    if value is None or value is pd.NA:
+        return None
+    # JSON booleans are extracted as 'true' and 'false', numpy booleans come from boolean DataFrame columns
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value)).lower()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
@@ -0,0 +1,111 @@
+"""
+Timing of the beneficiary upload pipeline stages.
+
+Every stage run inside ``upload_stage`` is recorded in ``IndividualDataSourceUpload.json_ext['stats'][<stage>]``
+with its duration, processed rows and throughput, and passed to the metrics hooks. Hooks are callables taking
+``(upload_id, stage, stats)``, they are added with ``register_upload_metrics_hook`` or listed as dotted paths in
+the ``upload_metrics_hooks`` configuration option, e.g. to forward the metrics to Prometheus or StatsD.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from django.db import connection, models
+from django.db.models import F, Value
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Coalesce
+from django.utils.module_loading import import_string
+
+from core import datetime
+from individual.models import IndividualDataSourceUpload
+from social_protection.apps import SocialProtectionConfig
+from social_protection.models import JSONUpdate
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'stats'
+
+# PQTRANS_INERROR of libpq, idle in a failed transaction block
+_PQ_TRANSACTION_INERROR = 3
+
+_metrics_hooks = []
+
+
+def register_upload_metrics_hook(hook: Callable[[str, str, Dict], None]):
+    _metrics_hooks.append(hook)
+
+
+@contextmanager
+def upload_stage(upload_id, stage: str, rows: int = None):
+    """
+    Measure the stage run in the with block. The yielded dict can be used to set 'rows' once the number
+    of processed rows is known. Stages are recorded also when they fail, with 'success' set to False.
+    """
+    stage_stats = {'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield stage_stats
+    except BaseException:
+        _finish_upload_stage(upload_id, stage, stage_stats, start, success=False)
+        raise
+    _finish_upload_stage(upload_id, stage, stage_stats, start, success=True)
+
+
+def _finish_upload_stage(upload_id, stage, stage_stats, start, success):
+    duration = time.perf_counter() - start
+    rows = stage_stats.get('rows')
+    stats = {
+        'duration_seconds': round(duration, 3),
+        'rows': rows,
+        'rows_per_second': round(rows / duration, 1) if rows and duration else None,
+        'success': success,
+        'finished_at': datetime.datetime.now().isoformat(),
+    }
+    if _is_transaction_aborted():
+        # Stage failed in a transaction which is rolled back anyway, any query would raise and hide the stage error
+        logger.debug("Upload %s stage %s: %s, not stored in the aborted transaction", upload_id, stage, stats)
+        _call_metrics_hooks(upload_id, stage, stats)
+    else:
+        record_upload_stage(upload_id, stage, stats)
+
+
+def record_upload_stage(upload_id, stage: str, stats: Dict):
+    if upload_id:
+        # Queryset update, so concurrent stages don't overwrite each other and the upload version isn't changed
+        json_ext_with_stats = JSONUpdate(
+            Coalesce(F('json_ext'), Value({}, output_field=models.JSONField())),
+            Value(f'{{{STATS_KEY}}}'),
+            Coalesce(KeyTransform(STATS_KEY, 'json_ext'), Value({}, output_field=models.JSONField())),
+            output_field=models.JSONField(),
+        )
+        IndividualDataSourceUpload.objects.filter(id=upload_id).update(json_ext=JSONUpdate(
+            json_ext_with_stats,
+            Value(f'{{{STATS_KEY},{stage}}}'),
+            Value(stats, output_field=models.JSONField()),
+            output_field=models.JSONField(),
+        ))
+    logger.debug("Upload %s stage %s: %s", upload_id, stage, stats)
+    _call_metrics_hooks(upload_id, stage, stats)
+
+
+def _call_metrics_hooks(upload_id, stage, stats):
+    for hook in _get_metrics_hooks():
+        try:
+            hook(str(upload_id), stage, stats)
+        except Exception as exc:
+            logger.warning("Upload metrics hook %s failed", hook, exc_info=exc)
+
+
+def _is_transaction_aborted():
+    if connection.needs_rollback:
+        return True
+    if connection.vendor != 'postgresql' or connection.connection is None:
+        return False
+    # Both psycopg2 and psycopg expose the libpq transaction status, the transaction is aborted after a failed query
+    info = getattr(connection.connection, 'info', None)
+    return info is not None and int(info.transaction_status) == _PQ_TRANSACTION_INERROR
+
+
+def _get_metrics_hooks():
+    return [*_metrics_hooks, *(import_string(path) for path in SocialProtectionConfig.upload_metrics_hooks or [])]
@@ -0,0 +1,165 @@
+"""
+Queues running beneficiary upload workflows outside of the upload request.
+
+With ``beneficiary_upload_queue`` set, ``import_beneficiaries`` only stores the workflow to run in the upload
+``json_ext`` and hands the upload over to the queue. The upload moves from ``TRIGGERED`` (queued) to ``IN_PROGRESS``
+once a worker claims it, the workflow then sets the final status, ``FAIL`` is set if the workflow couldn't be run.
+Workflows can finish after the worker returns (e.g. OpenFn jobs triggered by a webhook), uploads which don't reach
+a final status within ``beneficiary_upload_queue_timeout`` are failed by ``fail_stale_uploads``.
+
+Available queues:
+ * ``thread`` - runs the workflow in a background thread of the process which received the upload,
+ * ``database`` - the queued uploads are the queue, they are picked up by the
+   ``run_beneficiary_upload_queue`` management command.
+Other queues (e.g. backed by a message broker) can be added with ``register_upload_queue``.
+"""
+import logging
+import threading
+from datetime import datetime as py_datetime, timedelta
+
+from django.db import connection, transaction
+
+from core import datetime
+from individual.models import IndividualDataSourceUpload
+from social_protection.apps import SocialProtectionConfig
+
+logger = logging.getLogger(__name__)
+
+QUEUED_WORKFLOW_KEY = 'queued_workflow'
+
+
+class DatabaseUploadQueue:
+    def enqueue(self, upload_id):
+        # The queued upload itself is the queue entry, it's picked up by process_queued_uploads.
+        pass
+
+
+class ThreadUploadQueue:
+    def enqueue(self, upload_id):
+        thread = threading.Thread(target=self._run, args=(upload_id,), daemon=True)
+        transaction.on_commit(thread.start)
+
+    @staticmethod
+    def _run(upload_id):
+        try:
+            run_queued_upload(upload_id)
+        finally:
+            connection.close()
+
+
+UPLOAD_QUEUES = {
+    'thread': ThreadUploadQueue,
+    'database': DatabaseUploadQueue,
+}
+
+
+def register_upload_queue(name, queue_class):
+    UPLOAD_QUEUES[name] = queue_class
+
+
+def is_upload_queue_enabled():
+    return bool(SocialProtectionConfig.beneficiary_upload_queue)
+
+
+def get_upload_queue():
+    queue_name = SocialProtectionConfig.beneficiary_upload_queue
+    if queue_name not in UPLOAD_QUEUES:
+        raise ValueError(f'Unknown beneficiary upload queue: {queue_name}')
+    return UPLOAD_QUEUES[queue_name]()
+
+
+def enqueue_upload_workflow(upload: IndividualDataSourceUpload, workflow, benefit_plan, user):
+    upload.json_ext = {
+        **(upload.json_ext or {}),
+        QUEUED_WORKFLOW_KEY: {
+            'workflow_name': workflow.name,
+            'workflow_group': workflow.group,
+            'benefit_plan_uuid': str(benefit_plan.uuid),
+            'user_uuid': str(user.id),
+            'queued_at': datetime.datetime.now().isoformat(),
+        }
+    }
+    upload.status = IndividualDataSourceUpload.Status.TRIGGERED
+    upload.save(username=user.login_name)
+    get_upload_queue().enqueue(upload.id)
+
+
+def process_queued_uploads(limit=None):
+    """
+    Run workflows of the queued uploads, oldest first. Returns the number of uploads processed by this call.
+    """
+    queued = IndividualDataSourceUpload.objects \
+        .filter(status=IndividualDataSourceUpload.Status.TRIGGERED, json_ext__has_key=QUEUED_WORKFLOW_KEY) \
+        .order_by('date_created') \
+        .values_list('id', flat=True)
+    if limit:
+        queued = queued[:limit]
+    return sum(1 for upload_id in list(queued) if run_queued_upload(upload_id))
+
+
+def run_queued_upload(upload_id):
+    """
+    Claim the queued upload and run its workflow. Returns False if the upload was already claimed by another worker.
+    """
+    from core.models import User
+    from social_protection.models import BenefitPlan
+    from social_protection.services import BeneficiaryImportService
+
+    # Compare-and-set on the status, only one worker can move the upload out of TRIGGERED
+    claimed = IndividualDataSourceUpload.objects \
+        .filter(id=upload_id, status=IndividualDataSourceUpload.Status.TRIGGERED) \
+        .update(status=IndividualDataSourceUpload.Status.IN_PROGRESS, date_updated=py_datetime.now())
+    if not claimed:
+        return False
+
+    upload = IndividualDataSourceUpload.objects.get(id=upload_id)
+    queued_workflow = upload.json_ext[QUEUED_WORKFLOW_KEY]
+    try:
+        user = User.objects.get(id=queued_workflow['user_uuid'])
+        benefit_plan = BenefitPlan.objects.get(id=queued_workflow['benefit_plan_uuid'])
+        workflow = _get_workflow(queued_workflow['workflow_name'], queued_workflow['workflow_group'])
+        BeneficiaryImportService(user).run_workflow(workflow, upload, benefit_plan)
+    except Exception as exc:
+        logger.error("Error while running queued workflow of upload %s", upload_id, exc_info=exc)
+        IndividualDataSourceUpload.objects.filter(id=upload_id).update(
+            status=IndividualDataSourceUpload.Status.FAIL,
+            error={'workflow': str(exc)}
+        )
+    # The workflow sets the final status of the upload, possibly after it returned
+    return True
+
+
+def fail_stale_uploads(timeout=None):
+    """
+    Fail queued uploads still in progress ``timeout`` seconds (``beneficiary_upload_queue_timeout`` by default) after
+    they were claimed, e.g. when the workflow job was lost. Returns the number of failed uploads.
+    """
+    timeout = SocialProtectionConfig.beneficiary_upload_queue_timeout if timeout is None else timeout
+    if not timeout:
+        return 0
+    stale = IndividualDataSourceUpload.objects.filter(
+        status=IndividualDataSourceUpload.Status.IN_PROGRESS,
+        json_ext__has_key=QUEUED_WORKFLOW_KEY,
+        date_updated__lt=py_datetime.now() - timedelta(seconds=timeout),
+    )
+    failed = stale.update(
+        status=IndividualDataSourceUpload.Status.FAIL,
+        error={'workflow': f'Workflow did not finish within {timeout} seconds'},
+    )
+    if failed:
+        logger.warning("%s queued upload(s) failed after %s seconds in progress", failed, timeout)
+    return failed
+
+
+def _get_workflow(name, group):
+    from workflow.services import WorkflowService
+
+    result = WorkflowService.get_workflows(name, group)
+    if not result.get('success'):
+        raise ValueError('{}: {}'.format(result.get("message"), result.get("details")))
+    workflows = result.get('data', {}).get('workflows')
+    if not workflows:
+        raise ValueError('Workflow not found: group={} name={}'.format(group, name))
+    if len(workflows) > 1:
+        raise ValueError('Multiple workflows found: group={} name={}'.format(group, name))
+    return workflows[0]
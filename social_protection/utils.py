@@ -1,25 +1,95 @@
-from typing import Iterable
-from django.db.models import Q, Value, Func, F
+import datetime
+import decimal
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+import numpy as np
+from django.db.models import Q, Value, Func, F, Count, QuerySet
 import pandas as pd
 
 from individual.models import IndividualDataSource
+from social_protection.apps import SocialProtectionConfig
 
 
-def load_dataframe(individual_sources: Iterable[IndividualDataSource]) -> pd.DataFrame:
-    data_from_source = []
-    for individual_source in individual_sources:
-        json_ext = individual_source.json_ext
-        individual_source.json_ext["id"] = individual_source.id
-        data_from_source.append(json_ext)
-    recreated_df = pd.DataFrame(data_from_source)
+def load_dataframe(individual_sources: Iterable[IndividualDataSource], columns: Iterable[str] = None) -> pd.DataFrame:
+    """
+    Build a DataFrame from json_ext of the individual sources, with the source id in the 'id' column.
+    Querysets are streamed, only id and json_ext are fetched. With columns, only these json_ext keys are loaded.
+    """
+    recreated_df = pd.DataFrame(_iter_data_source_records(individual_sources, columns))
     return recreated_df
 
 
+def _iter_data_source_records(individual_sources, columns=None) -> Iterator[dict]:
+    if isinstance(individual_sources, QuerySet):
+        rows = individual_sources.values_list('id', 'json_ext').iterator(
+            chunk_size=SocialProtectionConfig.beneficiary_import_chunk_size
+        )
+    else:
+        rows = ((individual_source.id, individual_source.json_ext) for individual_source in individual_sources)
+
+    columns = list(columns) if columns is not None else None
+    for source_id, json_ext in rows:
+        json_ext = json_ext or {}
+        if columns is not None:
+            json_ext = {column: json_ext[column] for column in columns if column in json_ext}
+        yield {**json_ext, 'id': source_id}
+
+
+JSON_NATIVE_INFERRED_TYPES = {'empty', 'string', 'integer', 'floating', 'mixed-integer-float', 'boolean'}
+
+
+def dataframe_to_records(dataframe: pd.DataFrame) -> List[dict]:
+    """
+    Convert a DataFrame into JSON serializable dicts, one per row, in a single pass over the columns.
+    Missing values become None, numpy scalars become builtins and dates are formatted as ISO strings.
+    """
+    frame = pd.DataFrame(
+        {str(column): _json_safe_column(dataframe[column]) for column in dataframe.columns},
+        index=dataframe.index,
+    )
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict(orient='records')
+
+
+def _json_safe_column(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return _format_datetime_column(series)
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in JSON_NATIVE_INFERRED_TYPES:
+        return series.map(_json_safe_value)
+    return series
+
+
+def _format_datetime_column(series: pd.Series) -> pd.Series:
+    values = series.dropna()
+    if (values == values.dt.normalize()).all():
+        return series.dt.strftime('%Y-%m-%d')
+    return series.dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _json_safe_value(value):
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time.min and value.tzinfo is None:
+            return value.date().isoformat()
+        return value.isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def _valid_items_q():
+    return Q(validations__validation_errors=[])
+
+
 def fetch_summary_of_broken_items(upload_id):
     return list(IndividualDataSource.objects.filter(
         Q(is_deleted=False) &
         Q(upload_id=upload_id) &
-        ~Q(validations__validation_errors=[])
+        ~_valid_items_q()
     ).values_list('uuid', flat=True))
 
 
@@ -27,19 +97,50 @@ def fetch_summary_of_valid_items(upload_id):
     return list(IndividualDataSource.objects.filter(
         Q(is_deleted=False) &
         Q(upload_id=upload_id) &
-        Q(validations__validation_errors=[])
+        _valid_items_q()
     ).values_list('uuid', flat=True))
 
 
+def fetch_upload_statistics(upload_id, invalid_sample_size=0) -> dict:
+    """
+    Count valid and invalid items of an upload with a single aggregate query.
+    With invalid_sample_size, up to that many UUIDs of invalid items are returned in invalid_sample.
+    """
+    items = IndividualDataSource.objects.filter(is_deleted=False, upload_id=upload_id)
+    statistics = items.aggregate(
+        valid=Count('id', filter=_valid_items_q()),
+        invalid=Count('id', filter=~_valid_items_q()),
+    )
+    statistics['total'] = statistics['valid'] + statistics['invalid']
+    statistics['invalid_sample'] = list(
+        items.filter(~_valid_items_q()).values_list('uuid', flat=True)[:invalid_sample_size]
+    ) if invalid_sample_size and statistics['invalid'] else []
+    return statistics
+
+
 def calculate_percentage_of_invalid_items(upload_id):
-    number_of_valid_items = len(fetch_summary_of_valid_items(upload_id))
-    number_of_invalid_items = len(fetch_summary_of_broken_items(upload_id))
-    total_items = number_of_invalid_items + number_of_valid_items
+    statistics = fetch_upload_statistics(upload_id)
+    total_items = statistics['total']
 
     if total_items == 0:
         percentage_of_invalid_items = 0
     else:
-        percentage_of_invalid_items = (number_of_invalid_items / total_items) * 100
+        percentage_of_invalid_items = (statistics['invalid'] / total_items) * 100
 
     percentage_of_invalid_items = round(percentage_of_invalid_items, 2)
     return percentage_of_invalid_items
+
+
+def bulk_create_update_history(queryset, user, batch_size):
+    """
+    Write history records of rows changed with QuerySet.update, which bypasses save() and its history tracking.
+    Rows are read and recorded in batches, cached objects are refreshed along the way.
+    """
+    model = queryset.model
+    objects = queryset.iterator(chunk_size=batch_size)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return
+        model.history.bulk_history_create(batch, batch_size=batch_size, update=True, default_user=user)
+        model.bulk_update_cache(batch)
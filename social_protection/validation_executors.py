@@ -0,0 +1,106 @@
+"""
+Executors running beneficiary validation over the chunks of an uploaded file.
+
+``get_validation_executor`` picks the executor configured with ``validation_executor``, uploads smaller than
+``validation_inline_threshold`` rows are always validated inline, so no worker is started and nothing is pickled
+for them. The process pool is kept for the lifetime of the server process and shared by all uploads, it's shut
+down when the server process exits.
+"""
+import atexit
+import concurrent.futures
+import logging
+import math
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, List
+
+from pandas import DataFrame
+
+from social_protection.apps import SocialProtectionConfig
+
+logger = logging.getLogger(__name__)
+
+
+class InlineValidationExecutor:
+    workers = 1
+
+    def map(self, function: Callable, chunks: Iterable[DataFrame], *args) -> List:
+        return [function(chunk, *args) for chunk in chunks]
+
+    def split(self, dataframe: DataFrame) -> List[DataFrame]:
+        chunk_size = math.ceil(len(dataframe) / self.workers) or 1
+        return [dataframe[i:i + chunk_size] for i in range(0, dataframe.shape[0], chunk_size)]
+
+
+class ThreadPoolValidationExecutor(InlineValidationExecutor):
+    def __init__(self, workers: int):
+        self.workers = workers
+
+    def map(self, function: Callable, chunks: Iterable[DataFrame], *args) -> List:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return self._collect([executor.submit(function, chunk, *args) for chunk in chunks])
+
+    @staticmethod
+    def _collect(futures) -> List:
+        return [future.result() for future in concurrent.futures.as_completed(futures)]
+
+
+class ProcessPoolValidationExecutor(ThreadPoolValidationExecutor):
+    _pools = {}
+    _lock = threading.Lock()
+
+    def map(self, function: Callable, chunks: Iterable[DataFrame], *args) -> List:
+        chunks = list(chunks)
+        try:
+            return self._collect([self._get_pool().submit(function, chunk, *args) for chunk in chunks])
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by OOM killer), the pool can't be used anymore and is started again.
+            logger.warning("Validation process pool is broken, restarting it", exc_info=True)
+            self._discard_pool()
+            return self._collect([self._get_pool().submit(function, chunk, *args) for chunk in chunks])
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            pool = self._pools.get(self.workers)
+            if pool is None:
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+                self._pools[self.workers] = pool
+            return pool
+
+    def _discard_pool(self):
+        with self._lock:
+            pool = self._pools.pop(self.workers, None)
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    @classmethod
+    def shutdown_all(cls):
+        with cls._lock:
+            pools = list(cls._pools.values())
+            cls._pools.clear()
+        for pool in pools:
+            pool.shutdown()
+
+
+# Worker processes of the persistent pools are stopped together with the server process
+atexit.register(ProcessPoolValidationExecutor.shutdown_all)
+
+
+VALIDATION_EXECUTORS = {
+    'inline': lambda workers: InlineValidationExecutor(),
+    'thread': ThreadPoolValidationExecutor,
+    'process': ProcessPoolValidationExecutor,
+}
+
+
+def get_validation_executor(row_count: int, workers: int = None):
+    workers = workers or SocialProtectionConfig.validation_workers
+    if row_count < SocialProtectionConfig.validation_inline_threshold or workers <= 1:
+        return InlineValidationExecutor()
+
+    executor_name = SocialProtectionConfig.validation_executor
+    executor_class = VALIDATION_EXECUTORS.get(executor_name)
+    if executor_class is None:
+        logger.warning("Unknown validation executor '%s', validating inline", executor_name)
+        return InlineValidationExecutor()
+    return executor_class(workers)
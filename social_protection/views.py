@@ -1,8 +1,11 @@
+import csv
 import logging
 import json
 import pandas as pd
 
-from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q, F, Func, CharField
 from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
@@ -13,12 +16,14 @@ from im_export.views import check_user_rights
 from individual.apps import IndividualConfig
 from individual.models import IndividualDataSource
 from social_protection.apps import SocialProtectionConfig
-from social_protection.models import BenefitPlan
+from social_protection.models import BenefitPlan, BenefitPlanDataUploadRecords
 from social_protection.services import BeneficiaryImportService
 from workflow.services import WorkflowService
 
 logger = logging.getLogger(__name__)
 
+INVALID_ITEMS_EXPORT_CHUNK_SIZE = 2000
+
 
 def get_global_schema_fields(benefit_plan):
     schema = benefit_plan.beneficiary_data_schema if benefit_plan.beneficiary_data_schema \
@@ -136,23 +141,20 @@ def download_invalid_items(request):
             Q(is_deleted=False) &
             Q(upload_id=upload_id) &
             ~Q(validations__validation_errors=[])
-        )
-
-        data_from_source = []
-        for invalid_item in invalid_items:
-            json_ext = invalid_item.json_ext
-            invalid_item.json_ext["id"] = invalid_item.id
-            invalid_item.json_ext["error"] = invalid_item.validations
-            data_from_source.append(json_ext)
-
-        recreated_df = pd.DataFrame(data_from_source)
+        ).order_by('date_created', 'id')
+        columns = _get_invalid_items_columns(upload_id, invalid_items)
 
-        # Function to stream the DataFrame content as CSV
+        # Rows are written one by one while the queryset is read with a server-side cursor
         def stream_csv():
-            output = recreated_df.to_csv(index=False)
-            yield output.encode('utf-8')
+            writer = csv.writer(_EchoBuffer())
+            yield writer.writerow(columns).encode('utf-8')
+            rows = invalid_items.values_list('id', 'json_ext', 'validations').iterator(
+                chunk_size=INVALID_ITEMS_EXPORT_CHUNK_SIZE
+            )
+            for item_id, json_ext, validations in rows:
+                row = {**(json_ext or {}), 'id': item_id, 'error': validations}
+                yield writer.writerow([_format_csv_value(row.get(column)) for column in columns]).encode('utf-8')
 
-        # Create a streaming response with the CSV content
         response = StreamingHttpResponse(
             stream_csv(), content_type='text/csv'
         )
@@ -168,6 +170,52 @@ def download_invalid_items(request):
         return Response({'success': False, 'error': str(exc)}, status=500)
 
 
+class _EchoBuffer:
+    """File-like object returning what is written to it, lets csv.writer produce rows for a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def _get_invalid_items_columns(upload_id, invalid_items):
+    """
+    Columns of the invalid items export, the benefit plan schema fields are followed by any other key
+    found in the uploaded rows, so the header is known before the first row is streamed.
+    """
+    columns = []
+    upload_record = BenefitPlanDataUploadRecords.objects \
+        .filter(data_upload_id=upload_id, is_deleted=False) \
+        .select_related('benefit_plan') \
+        .first()
+    if upload_record:
+        schema = upload_record.benefit_plan.beneficiary_data_schema or {}
+        columns.extend(['first_name', 'last_name', 'dob', *schema.get('properties', {}).keys()])
+
+    if connection.vendor == 'postgresql':
+        uploaded_keys = invalid_items \
+            .annotate(key=Func(F('json_ext'), function='jsonb_object_keys', output_field=CharField())) \
+            .values_list('key', flat=True) \
+            .order_by() \
+            .distinct()
+    else:
+        uploaded_keys = {
+            key
+            for json_ext in invalid_items.values_list('json_ext', flat=True).iterator(
+                chunk_size=INVALID_ITEMS_EXPORT_CHUNK_SIZE
+            )
+            for key in (json_ext or {})
+        }
+
+    columns.extend(sorted(set(uploaded_keys) - set(columns)))
+    return ['id', *[column for column in dict.fromkeys(columns) if column not in ('id', 'error')], 'error']
+
+
+def _format_csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
 @api_view(["GET"])
 @permission_classes([check_user_rights(IndividualConfig.gql_individual_search_perms, )])
 def download_beneficiary_upload(request):
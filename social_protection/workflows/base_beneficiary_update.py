@@ -19,32 +19,6 @@ def process_update_beneficiaries_workflow(user_uuid, benefit_plan_uuid, upload_u
 
 
 update_sql = """
-CREATE OR REPLACE FUNCTION filter_jsonb(data jsonb, schema jsonb)
-RETURNS jsonb AS $$
-DECLARE
-  key text;
-  value text;
-  result jsonb := '{}';
-BEGIN
-  FOR key, value IN SELECT * FROM jsonb_each_text(data)
-  LOOP
-    IF schema ? key THEN
-      result := result || jsonb_build_object(key, value);
-    END IF;
-  END LOOP;
-  RETURN result;
-END;
-$$ LANGUAGE plpgsql;
-        
-DO $$ BEGIN
-            CREATE TYPE failing_entry_beneficiary_upload AS (
-            uuids TEXT[],
-            ordinals INT[]
-            );
-        EXCEPTION
-            WHEN duplicate_object THEN null;
-        END $$;
-       
 DO $$
 declare
     current_upload_id UUID := %s::UUID;
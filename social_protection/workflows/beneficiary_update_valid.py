@@ -1,7 +1,7 @@
 import logging
 
 from core.models import User
-from social_protection.workflows.utils import SqlProcedurePythonWorkflow
+from social_protection.workflows.utils import BatchedSqlProcedurePythonWorkflow
 from social_protection.services import BeneficiaryImportService
 from social_protection.models import BenefitPlan
 
@@ -10,260 +10,97 @@ logger = logging.getLogger(__name__)
 
 def process_update_valid_beneficiaries_workflow(user_uuid, benefit_plan_uuid, upload_uuid, accepted=None):
     user = User.objects.get(id=user_uuid)
-    service = SqlProcedurePythonWorkflow(benefit_plan_uuid, upload_uuid, user_uuid, accepted)
+    service = BatchedSqlProcedurePythonWorkflow(benefit_plan_uuid, upload_uuid, user_uuid, accepted)
     service.validate_dataframe_headers(True)
     if isinstance(accepted, list):
-        service.execute(upload_sql_partial, [upload_uuid, user_uuid, benefit_plan_uuid, accepted])
+        service.execute(validation_sql, update_batch_sql)
     else:
-        service.execute(upload_sql, [upload_uuid, user_uuid, benefit_plan_uuid])
+        service.execute(validation_sql, update_batch_sql, finalize_sql)
     benefit_plan = BenefitPlan.objects.get(id=benefit_plan_uuid)
     BeneficiaryImportService(user).synchronize_data_for_reporting(upload_uuid, benefit_plan)
 
 
-upload_sql = """     
--- Setup 
-CREATE OR REPLACE FUNCTION filter_jsonb(data jsonb, schema jsonb)
-RETURNS jsonb AS $$
-DECLARE
-  key text;
-  value text;
-  result jsonb := '{}';
-BEGIN
-  FOR key, value IN SELECT * FROM jsonb_each_text(data)
-  LOOP
-    IF schema ? key THEN
-      result := result || jsonb_build_object(key, value);
-    END IF;
-  END LOOP;
-  RETURN result;
-END;
-$$ LANGUAGE plpgsql;
-        
-DO $$ BEGIN
-            CREATE TYPE failing_entry_beneficiary_upload AS (
-            uuids TEXT[],
-            ordinals INT[]
-            );
-        EXCEPTION
-            WHEN duplicate_object THEN null;
-        END $$;
-        
--- Update procedure   
+validation_sql = """
 DO $$
-declare
-    current_upload_id UUID := %s::UUID;
-    userUUID UUID := %s::UUID;
-    benefitPlan UUID := %s::UUID;
-    failing_entries UUID[];
-    json_schema jsonb;
-    
+DECLARE
+    current_upload_id UUID := %(upload_id)s::UUID;
+    benefitPlan UUID := %(benefit_plan_id)s::UUID;
+    accepted UUID[] := %(accepted)s::UUID[]; -- NULL if all entries are updated
     failing_entries_invalid_id failing_entry_beneficiary_upload;
 BEGIN
-    -- existing code for finding failing_entries_first_name, failing_entries_last_name, failing_entries_dob
-
-    -- Check if any entries have invalid Json_ext according to the schema
-    SELECT beneficiary_data_schema INTO json_schema FROM social_protection_benefitplan WHERE "UUID" = benefitPlan;
-
+    -- Check if all entries reference beneficiaries of the benefit plan
     SELECT ARRAY_AGG("UUID") AS "UUID", ARRAY_AGG("ordinal") AS "ORDINALS" INTO failing_entries_invalid_id
     FROM (
         SELECT ("Json_ext" ->> 'ID')::UUID as beneficiary_uuid,  row_number() OVER (ORDER BY "UUID") AS ordinal, "UUID"
         FROM individual_individualdatasource
         WHERE upload_id = current_upload_id
+        AND (accepted IS NULL OR "UUID" = ANY(accepted))
     ) AS f
     WHERE not beneficiary_uuid in (select "UUID" from social_protection_beneficiary spb where benefit_plan_id = benefitPlan);
-   
+
     IF failing_entries_invalid_id IS NOT NULL THEN
         UPDATE individual_individualdatasourceupload
         SET error = coalesce(error, '{}'::jsonb) || jsonb_build_object('errors', jsonb_build_object(
-                            'error', 'Invalid entries', 
-                            'timestamp', NOW()::text, 
+                            'error', 'Invalid entries',
+                            'timestamp', NOW()::text,
                             'upload_id', current_upload_id::text,
                             'failing_entries_invalid_id', failing_entries_invalid_id
-                        ))
+                        )),
+            status = 'FAIL'
         WHERE "UUID" = current_upload_id;
-       
-       update individual_individualdatasourceupload set status='FAIL' where "UUID" = current_upload_id;
-
-    -- If no invalid entries, then proceed with the data manipulation
-    ELSE
-        begin 
-            -- Update social_protection_beneficiary
-          with updated_beneficiaries as (
-          update  social_protection_beneficiary
-      set "Json_ext" = social_protection_beneficiary."Json_ext" || filter_jsonb(ids."Json_ext", json_schema -> 'properties') - 'first_name' - 'last_name' - 'dob', "DateUpdated" = NOW()
-            FROM individual_individualdatasource ids
-        WHERE upload_id=current_upload_id 
-          and social_protection_beneficiary."UUID" = (ids."Json_ext" ->> 'ID')::UUID
-          and social_protection_beneficiary."isDeleted"=false
-          and validations ->> 'validation_errors' = '[]'
-          
-        RETURNING social_protection_beneficiary."UUID", ids."Json_ext", social_protection_beneficiary."individual_id", ids."UUID" as individualdatasource_id
-          ),
-          updated_individuals as ( UPDATE individual_individual
-            SET first_name = COALESCE(f."Json_ext"->>'first_name', first_name),
-            last_name = COALESCE(f."Json_ext"->>'last_name', last_name),
-            dob = COALESCE(to_date(f."Json_ext"->>'dob', 'YYYY-MM-DD'), dob),
-            "DateUpdated" = NOW(),
-            "Json_ext" = f."Json_ext"
-            FROM updated_beneficiaries f 
-            WHERE individual_individual."UUID" = f.individual_id 
-            returning individual_individual."UUID", f.individualdatasource_id)
-           
-            UPDATE individual_individualdatasource
-      SET individual_id = u."UUID"
-      FROM updated_individuals u
-      WHERE upload_id=current_upload_id 
-        and individual_individualdatasource.individual_id is null 
-        and "isDeleted"=False 
-        and individual_individualdatasource."UUID" = u.individualdatasource_id
-        and validations ->> 'validation_errors' = '[]';
-            
-            -- Change status to SUCCESS if no invalid items, change to PARTIAL_SUCCESS otherwise 
-            UPDATE individual_individualdatasourceupload
-            SET 
-                status = CASE
-                    WHEN (
-                        SELECT count(*) 
-                        FROM individual_individualdatasource
-                        WHERE upload_id=current_upload_id
-                            AND "isDeleted"=FALSE
-                            AND validations ->> 'validation_errors' = '[]'
-                    ) = (
-                        SELECT count(*) 
-                        FROM individual_individualdatasource
-                        WHERE upload_id=current_upload_id
-                            AND "isDeleted"=FALSE
-                    ) THEN 'SUCCESS'
-                    ELSE 'PARTIAL_SUCCESS'
-                END,
-                error = '{}'
-            WHERE "UUID" = current_upload_id;
-            EXCEPTION
-              WHEN OTHERS then
-  
-              update individual_individualdatasourceupload set status='FAIL' where "UUID" = current_upload_id;
-                  UPDATE individual_individualdatasourceupload
-                  SET error = coalesce(error, '{}'::jsonb) || jsonb_build_object('errors', jsonb_build_object(
-                                      'error', SQLERRM,
-                                      'timestamp', NOW()::text,
-                                      'upload_id', current_upload_id::text
-                                  ))
-                  WHERE "UUID" = current_upload_id;
-                END;
-        END IF;
-        end $$
-        """
-
-upload_sql_partial = """
--- Setup 
-CREATE OR REPLACE FUNCTION filter_jsonb(data jsonb, schema jsonb)
-RETURNS jsonb AS $$
-DECLARE
-  key text;
-  value text;
-  result jsonb := '{}';
-BEGIN
-  FOR key, value IN SELECT * FROM jsonb_each_text(data)
-  LOOP
-    IF schema ? key THEN
-      result := result || jsonb_build_object(key, value);
     END IF;
-  END LOOP;
-  RETURN result;
-END;
-$$ LANGUAGE plpgsql;
-        
-DO $$ BEGIN
-            CREATE TYPE failing_entry_beneficiary_upload AS (
-            uuids TEXT[],
-            ordinals INT[]
-            );
-        EXCEPTION
-            WHEN duplicate_object THEN null;
-        END $$;
-        
-DO $$
-DECLARE
-    current_upload_id UUID := %s::UUID;
-    userUUID UUID := %s::UUID;
-    benefitPlan UUID := %s::UUID;
-    failing_entries UUID[];
-    json_schema jsonb;
-    accepted UUID[] := %s::UUID[];
-    failing_entries_invalid_id failing_entry_beneficiary_upload;
-BEGIN
-    -- existing code for finding failing_entries_first_name, failing_entries_last_name, failing_entries_dob
+END $$
+"""
 
-    -- Check if any entries have invalid Json_ext according to the schema
-    SELECT beneficiary_data_schema INTO json_schema FROM social_protection_benefitplan WHERE "UUID" = benefitPlan;
+# Updates beneficiaries and individuals of the entries in the (lower_bound, upper_bound] range of data source ids
+update_batch_sql = """
+WITH updated_beneficiaries AS (
+    UPDATE social_protection_beneficiary
+    SET "Json_ext" = social_protection_beneficiary."Json_ext" || filter_jsonb(ids."Json_ext", bp.beneficiary_data_schema -> 'properties') - 'first_name' - 'last_name' - 'dob',
+        "DateUpdated" = NOW()
+    FROM individual_individualdatasource ids, social_protection_benefitplan bp
+    WHERE bp."UUID" = %(benefit_plan_id)s::UUID
+      AND ids.upload_id = %(upload_id)s::UUID
+      AND (%(lower_bound)s::UUID IS NULL OR ids."UUID" > %(lower_bound)s::UUID)
+      AND (%(upper_bound)s::UUID IS NULL OR ids."UUID" <= %(upper_bound)s::UUID)
+      AND (%(accepted)s::UUID[] IS NULL OR ids."UUID" = ANY(%(accepted)s::UUID[]))
+      AND ids.validations ->> 'validation_errors' = '[]'
+      AND social_protection_beneficiary."UUID" = (ids."Json_ext" ->> 'ID')::UUID
+      AND social_protection_beneficiary.benefit_plan_id = bp."UUID"
+      AND social_protection_beneficiary."isDeleted" = false
+    RETURNING social_protection_beneficiary."UUID", ids."Json_ext", social_protection_beneficiary."individual_id", ids."UUID" as individualdatasource_id
+),
+updated_individuals AS (
+    UPDATE individual_individual
+    SET first_name = COALESCE(f."Json_ext"->>'first_name', first_name),
+        last_name = COALESCE(f."Json_ext"->>'last_name', last_name),
+        dob = COALESCE(to_date(f."Json_ext"->>'dob', 'YYYY-MM-DD'), dob),
+        "DateUpdated" = NOW(),
+        "Json_ext" = f."Json_ext"
+    FROM updated_beneficiaries f
+    WHERE individual_individual."UUID" = f.individual_id
+    RETURNING individual_individual."UUID", f.individualdatasource_id
+)
+UPDATE individual_individualdatasource
+SET individual_id = u."UUID"
+FROM updated_individuals u
+WHERE individual_individualdatasource."UUID" = u.individualdatasource_id
+  AND individual_individualdatasource.individual_id IS NULL
+  AND individual_individualdatasource."isDeleted" = False
+"""
 
-    SELECT ARRAY_AGG("UUID") AS "UUID", ARRAY_AGG("ordinal") AS "ORDINALS" INTO failing_entries_invalid_id
-    FROM (
-        SELECT ("Json_ext" ->> 'ID')::UUID as beneficiary_uuid,  row_number() OVER (ORDER BY "UUID") AS ordinal, "UUID"
+# Change status to SUCCESS if no invalid items, change to PARTIAL_SUCCESS otherwise
+finalize_sql = """
+UPDATE individual_individualdatasourceupload
+SET
+    status = (
+        SELECT CASE
+            WHEN count(*) FILTER (WHERE validations ->> 'validation_errors' = '[]') = count(*) THEN 'SUCCESS'
+            ELSE 'PARTIAL_SUCCESS'
+        END
         FROM individual_individualdatasource
-        WHERE upload_id = current_upload_id
-        AND ("UUID" = ANY(accepted)) /* Filter based on accepted if not NULL */
-    ) AS f
-    WHERE not beneficiary_uuid in (select "UUID" from social_protection_beneficiary spb where benefit_plan_id = benefitPlan);
-   
-    IF failing_entries_invalid_id IS NOT NULL THEN
-        UPDATE individual_individualdatasourceupload
-        SET error = coalesce(error, '{}'::jsonb) || jsonb_build_object('errors', jsonb_build_object(
-                            'error', 'Invalid entries', 
-                            'timestamp', NOW()::text, 
-                            'upload_id', current_upload_id::text,
-                            'failing_entries_invalid_id', failing_entries_invalid_id
-                        ))
-        WHERE "UUID" = current_upload_id;
-       
-       UPDATE individual_individualdatasourceupload SET status='FAIL' WHERE "UUID" = current_upload_id;
-
-    ELSE
-        BEGIN 
-            -- Update social_protection_beneficiary
-          WITH updated_beneficiaries AS (
-          UPDATE  social_protection_beneficiary
-          SET "Json_ext" = social_protection_beneficiary."Json_ext" || filter_jsonb(ids."Json_ext", json_schema -> 'properties') - 'first_name' - 'last_name' - 'dob', "DateUpdated" = NOW()
-            FROM individual_individualdatasource ids
-            WHERE upload_id = current_upload_id 
-              AND social_protection_beneficiary."UUID" = (ids."Json_ext" ->> 'ID')::UUID
-              AND social_protection_beneficiary."isDeleted" = false
-              AND (ids."UUID" = ANY(accepted)) /* Filter based on accepted if not NULL */
-              AND validations ->> 'validation_errors' = '[]'
-          RETURNING social_protection_beneficiary."UUID", ids."Json_ext", social_protection_beneficiary."individual_id", ids."UUID" as individualdatasource_id
-          ),
-          updated_individuals AS ( 
-            UPDATE individual_individual
-            SET first_name = COALESCE(f."Json_ext"->>'first_name', first_name),
-                last_name = COALESCE(f."Json_ext"->>'last_name', last_name),
-                dob = COALESCE(to_date(f."Json_ext"->>'dob', 'YYYY-MM-DD'), dob),
-                "DateUpdated" = NOW(),
-                "Json_ext" = f."Json_ext"
-            FROM updated_beneficiaries f 
-            WHERE individual_individual."UUID" = f.individual_id 
-            RETURNING individual_individual."UUID", f.individualdatasource_id)
-           
-          UPDATE individual_individualdatasource
-          SET individual_id = u."UUID"
-          FROM updated_individuals u
-          WHERE upload_id = current_upload_id 
-            AND individual_individualdatasource.individual_id IS NULL 
-            AND "isDeleted" = False 
-            AND individual_individualdatasource."UUID" = u.individualdatasource_id
-            AND (individual_individualdatasource."UUID" = ANY(accepted)) /* Filter based on accepted if not NULL */
-            AND validations ->> 'validation_errors' = '[]';
-            
-          EXCEPTION
-            WHEN OTHERS THEN
-              UPDATE individual_individualdatasourceupload SET status = 'FAIL' WHERE "UUID" = current_upload_id;
-              UPDATE individual_individualdatasourceupload
-              SET error = coalesce(error, '{}'::jsonb) || jsonb_build_object('errors', jsonb_build_object(
-                              'error', SQLERRM,
-                              'timestamp', NOW()::text,
-                              'upload_id', current_upload_id::text
-                          ))
-              WHERE "UUID" = current_upload_id;
-        END;
-    END IF;
-END $$
-"""
\ No newline at end of file
+        WHERE upload_id = %(upload_id)s::UUID AND "isDeleted" = FALSE
+    ),
+    error = '{}'
+WHERE "UUID" = %(upload_id)s::UUID
+"""
@@ -12,10 +12,11 @@ def process_import_valid_beneficiaries_workflow(user_uuid, benefit_plan_uuid, up
     user = User.objects.get(id=user_uuid)
     service = SqlProcedurePythonWorkflow(benefit_plan_uuid, upload_uuid, user_uuid, accepted)
     service.validate_dataframe_headers()
+    schema_failures = service.find_schema_failures()
     if isinstance(accepted, list):
-        service.execute(upload_sql_partial, [upload_uuid, user_uuid, benefit_plan_uuid, accepted])
+        service.execute(upload_sql_partial, [upload_uuid, user_uuid, benefit_plan_uuid, accepted, schema_failures])
     else:
-        service.execute(upload_sql, [upload_uuid, user_uuid, benefit_plan_uuid])
+        service.execute(upload_sql, [upload_uuid, user_uuid, benefit_plan_uuid, schema_failures])
     benefit_plan = BenefitPlan.objects.get(id=benefit_plan_uuid)
     BeneficiaryImportService(user).synchronize_data_for_reporting(upload_uuid, benefit_plan)
 
@@ -26,31 +27,30 @@ DECLARE
     current_upload_id UUID := %s::UUID;
     userUUID UUID := %s::UUID;
     benefitPlan UUID := %s::UUID;
-    failing_entries UUID[];
+    schema_failures UUID[] := %s::UUID[]; -- Rows failing the schema validated in Python, NULL to validate them here
     json_schema jsonb;
     failing_entries_invalid_json UUID[];
     failing_entries_first_name UUID[];
     failing_entries_last_name UUID[];
     failing_entries_dob UUID[];
 BEGIN
-    -- Check if all required fields are present in the entries
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_first_name
-    FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT "Json_ext" ? 'first_name';
-
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_last_name
-    FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT "Json_ext" ? 'last_name';
+    SELECT beneficiary_data_schema INTO json_schema FROM social_protection_benefitplan WHERE "UUID" = benefitPlan;
 
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_dob
+    -- Check required fields and the schema of all pending entries in a single scan
+    SELECT
+        ARRAY_AGG("UUID") FILTER (WHERE NOT "Json_ext" ? 'first_name'),
+        ARRAY_AGG("UUID") FILTER (WHERE NOT "Json_ext" ? 'last_name'),
+        ARRAY_AGG("UUID") FILTER (WHERE NOT "Json_ext" ? 'dob'),
+        ARRAY_AGG("UUID") FILTER (WHERE CASE WHEN schema_failures IS NULL
+                                             THEN NOT validate_json_schema(json_schema, "Json_ext")
+                                             ELSE FALSE END)
+    INTO failing_entries_first_name, failing_entries_last_name, failing_entries_dob, failing_entries_invalid_json
     FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT "Json_ext" ? 'dob';
+    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False;
 
-    -- Check if any entries have invalid Json_ext according to the schema
-    SELECT beneficiary_data_schema INTO json_schema FROM social_protection_benefitplan WHERE "UUID" = benefitPlan;
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_invalid_json
-    FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT validate_json_schema(json_schema, "Json_ext");
+    IF schema_failures IS NOT NULL THEN
+        failing_entries_invalid_json := NULLIF(schema_failures, '{}');
+    END IF;
 
     -- If any entries do not meet the criteria or missing required fields, set the error message in the upload table and do not proceed further
     IF failing_entries_invalid_json IS NOT NULL OR failing_entries_first_name IS NOT NULL OR failing_entries_last_name IS NOT NULL OR failing_entries_dob IS NOT NULL THEN
@@ -63,60 +63,50 @@ BEGIN
                             'failing_entries_last_name', failing_entries_last_name,
                             'failing_entries_dob', failing_entries_dob,
                             'failing_entries_invalid_json', failing_entries_invalid_json
-                        ))
+                        )),
+            status = 'FAIL'
         WHERE "UUID" = current_upload_id;
-        
-        UPDATE individual_individualdatasourceupload SET status = 'FAIL' WHERE "UUID" = current_upload_id;
     ELSE
-        -- If no invalid entries, then proceed with the data manipulation
-        WITH new_entry AS (
+        -- If no invalid entries, then proceed with the data manipulation.
+        -- Individual ids are generated up front, so every data source is linked by its own id to its individual.
+        WITH to_import AS MATERIALIZED (
+            SELECT "UUID" AS data_source_id, gen_random_uuid() AS individual_id, "Json_ext"
+            FROM individual_individualdatasource
+            WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND validations ->> 'validation_errors' = '[]'
+        ), new_individual AS (
             INSERT INTO individual_individual(
                 "UUID", "isDeleted", version, "UserCreatedUUID", "UserUpdatedUUID",
                 "Json_ext", first_name, last_name, dob
             )
-            SELECT gen_random_uuid(), false, 1, userUUID, userUUID,
+            SELECT individual_id, false, 1, userUUID, userUUID,
                    "Json_ext", "Json_ext"->>'first_name', "Json_ext" ->> 'last_name', to_date("Json_ext" ->> 'dob', 'YYYY-MM-DD')
-            FROM individual_individualdatasource
-            WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND validations ->> 'validation_errors' = '[]'
-            RETURNING "UUID", "Json_ext"
+            FROM to_import
+            RETURNING "UUID"
+        ), linked_data_source AS (
+            UPDATE individual_individualdatasource
+            SET individual_id = new_individual."UUID"
+            FROM to_import JOIN new_individual ON new_individual."UUID" = to_import.individual_id
+            WHERE individual_individualdatasource."UUID" = to_import.data_source_id
         )
-        UPDATE individual_individualdatasource
-        SET individual_id = ne."UUID"
-        FROM new_entry ne
-        WHERE individual_individualdatasource.upload_id = current_upload_id
-          AND individual_individualdatasource.individual_id IS NULL
-          AND individual_individualdatasource."isDeleted" = False
-          AND individual_individualdatasource."Json_ext" = ne."Json_ext"
-          AND validations ->> 'validation_errors' = '[]';
-        
-        with new_entry_2 as (INSERT INTO social_protection_beneficiary(
-        "UUID", "isDeleted", "Json_ext", "DateCreated", "DateUpdated", version, "DateValidFrom", "DateValidTo", status, "benefit_plan_id", "individual_id", "UserCreatedUUID", "UserUpdatedUUID"
+        INSERT INTO social_protection_beneficiary(
+            "UUID", "isDeleted", "Json_ext", "DateCreated", "DateUpdated", version, "DateValidFrom", "DateValidTo", status, "benefit_plan_id", "individual_id", "UserCreatedUUID", "UserUpdatedUUID"
         )
-        SELECT gen_random_uuid(), false, iids."Json_ext" - 'first_name' - 'last_name' - 'dob', NOW(), NOW(), 1, NOW(), NULL, 'POTENTIAL', benefitPlan, new_entry."UUID", userUUID, userUUID
-        FROM individual_individualdatasource iids right join individual_individual new_entry on new_entry."UUID" = iids.individual_id
-        WHERE iids.upload_id=current_upload_id and iids."isDeleted"=false
-        returning "UUID")
-        
-        -- Change status to SUCCESS if no invalid items, change to PARTIAL_SUCCESS otherwise 
-            UPDATE individual_individualdatasourceupload
-            SET 
-                status = CASE
-                    WHEN (
-                        SELECT count(*) 
-                        FROM individual_individualdatasource
-                        WHERE upload_id=current_upload_id
-                            AND "isDeleted"=FALSE
-                            AND validations ->> 'validation_errors' = '[]'
-                    ) = (
-                        SELECT count(*) 
-                        FROM individual_individualdatasource
-                        WHERE upload_id=current_upload_id
-                            AND "isDeleted"=FALSE
-                    ) THEN 'SUCCESS'
+        SELECT gen_random_uuid(), false, to_import."Json_ext" - 'first_name' - 'last_name' - 'dob', NOW(), NOW(), 1, NOW(), NULL, 'POTENTIAL', benefitPlan, new_individual."UUID", userUUID, userUUID
+        FROM to_import JOIN new_individual ON new_individual."UUID" = to_import.individual_id;
+
+        -- Change status to SUCCESS if no invalid items, change to PARTIAL_SUCCESS otherwise
+        UPDATE individual_individualdatasourceupload
+        SET
+            status = (
+                SELECT CASE
+                    WHEN count(*) FILTER (WHERE validations ->> 'validation_errors' = '[]') = count(*) THEN 'SUCCESS'
                     ELSE 'PARTIAL_SUCCESS'
-                END,
-                error = '{}'
-            WHERE "UUID" = current_upload_id;
+                END
+                FROM individual_individualdatasource
+                WHERE upload_id = current_upload_id AND "isDeleted" = FALSE
+            ),
+            error = '{}'
+        WHERE "UUID" = current_upload_id;
     END IF;
 EXCEPTION WHEN OTHERS THEN
     UPDATE individual_individualdatasourceupload SET status = 'FAIL', error = jsonb_build_object(
@@ -136,34 +126,31 @@ DECLARE
     userUUID UUID := %s::UUID;
     benefitPlan UUID := %s::UUID;
     accepted UUID[] := %s::UUID[]; -- Placeholder for the accepted UUIDs array, can be NULL
-    failing_entries UUID[];
+    schema_failures UUID[] := %s::UUID[]; -- Rows failing the schema validated in Python, NULL to validate them here
     json_schema jsonb;
     failing_entries_invalid_json UUID[];
     failing_entries_first_name UUID[];
     failing_entries_last_name UUID[];
     failing_entries_dob UUID[];
 BEGIN
-    -- Check if all required fields are present in the entries, with accepted filter applied if not NULL
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_first_name
-    FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT "Json_ext" ? 'first_name'
-    AND (accepted IS NULL OR "UUID" = ANY(accepted));
-
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_last_name
-    FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT "Json_ext" ? 'last_name'
-    AND (accepted IS NULL OR "UUID" = ANY(accepted));
+    SELECT beneficiary_data_schema INTO json_schema FROM social_protection_benefitplan WHERE "UUID" = benefitPlan;
 
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_dob
+    -- Check required fields and the schema of all pending entries in a single scan, with accepted filter applied if not NULL
+    SELECT
+        ARRAY_AGG("UUID") FILTER (WHERE NOT "Json_ext" ? 'first_name'),
+        ARRAY_AGG("UUID") FILTER (WHERE NOT "Json_ext" ? 'last_name'),
+        ARRAY_AGG("UUID") FILTER (WHERE NOT "Json_ext" ? 'dob'),
+        ARRAY_AGG("UUID") FILTER (WHERE CASE WHEN schema_failures IS NULL
+                                             THEN NOT validate_json_schema(json_schema, "Json_ext")
+                                             ELSE FALSE END)
+    INTO failing_entries_first_name, failing_entries_last_name, failing_entries_dob, failing_entries_invalid_json
     FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT "Json_ext" ? 'dob'
+    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False
     AND (accepted IS NULL OR "UUID" = ANY(accepted));
 
-    -- Check if any entries have invalid Json_ext according to the schema, with accepted filter applied if not NULL
-    SELECT ARRAY_AGG("UUID") INTO failing_entries_invalid_json
-    FROM individual_individualdatasource
-    WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND NOT validate_json_schema(json_schema, "Json_ext")
-    AND (accepted IS NULL OR "UUID" = ANY(accepted));
+    IF schema_failures IS NOT NULL THEN
+        failing_entries_invalid_json := NULLIF(schema_failures, '{}');
+    END IF;
 
     -- If any entries do not meet the criteria or missing required fields, set the error message in the upload table and do not proceed further
     IF failing_entries_invalid_json IS NOT NULL OR failing_entries_first_name IS NOT NULL OR failing_entries_last_name IS NOT NULL OR failing_entries_dob IS NOT NULL THEN
@@ -176,41 +163,37 @@ BEGIN
                             'failing_entries_last_name', failing_entries_last_name,
                             'failing_entries_dob', failing_entries_dob,
                             'failing_entries_invalid_json', failing_entries_invalid_json
-                        ))
+                        )),
+            status = 'FAIL'
         WHERE "UUID" = current_upload_id;
-
-        UPDATE individual_individualdatasourceupload SET status = 'FAIL' WHERE "UUID" = current_upload_id;
     ELSE
-        -- If no invalid entries, then proceed with the data manipulation, considering the accepted filter
-        WITH new_entry AS (
+        -- If no invalid entries, then proceed with the data manipulation, considering the accepted filter.
+        -- Individual ids are generated up front, so every data source is linked by its own id to its individual.
+        WITH to_import AS MATERIALIZED (
+            SELECT "UUID" AS data_source_id, gen_random_uuid() AS individual_id, "Json_ext"
+            FROM individual_individualdatasource
+            WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND validations ->> 'validation_errors' = '[]'
+            AND (accepted IS NULL OR "UUID" = ANY(accepted))
+        ), new_individual AS (
             INSERT INTO individual_individual(
                 "UUID", "isDeleted", version, "UserCreatedUUID", "UserUpdatedUUID",
                 "Json_ext", first_name, last_name, dob
             )
-            SELECT gen_random_uuid(), false, 1, userUUID, userUUID,
+            SELECT individual_id, false, 1, userUUID, userUUID,
                    "Json_ext", "Json_ext"->>'first_name', "Json_ext" ->> 'last_name', to_date("Json_ext" ->> 'dob', 'YYYY-MM-DD')
-            FROM individual_individualdatasource
-            WHERE upload_id = current_upload_id AND individual_id IS NULL AND "isDeleted" = False AND validations ->> 'validation_errors' = '[]'
-            AND (accepted IS NULL OR "UUID" = ANY(accepted))
-            RETURNING "UUID", "Json_ext"
+            FROM to_import
+            RETURNING "UUID"
+        ), linked_data_source AS (
+            UPDATE individual_individualdatasource
+            SET individual_id = new_individual."UUID"
+            FROM to_import JOIN new_individual ON new_individual."UUID" = to_import.individual_id
+            WHERE individual_individualdatasource."UUID" = to_import.data_source_id
         )
-        UPDATE individual_individualdatasource
-        SET individual_id = ne."UUID"
-        FROM new_entry ne
-        WHERE individual_individualdatasource.upload_id = current_upload_id
-          AND individual_individualdatasource.individual_id IS NULL
-          AND individual_individualdatasource."isDeleted" = False
-          AND individual_individualdatasource."Json_ext" = ne."Json_ext"
-          AND validations ->> 'validation_errors' = '[]'
-          AND (accepted IS NULL OR individual_individualdatasource."UUID" = ANY(accepted));
-
         INSERT INTO social_protection_beneficiary(
-        "UUID", "isDeleted", "Json_ext", "DateCreated", "DateUpdated", version, "DateValidFrom", "DateValidTo", status, "benefit_plan_id", "individual_id", "UserCreatedUUID", "UserUpdatedUUID"
+            "UUID", "isDeleted", "Json_ext", "DateCreated", "DateUpdated", version, "DateValidFrom", "DateValidTo", status, "benefit_plan_id", "individual_id", "UserCreatedUUID", "UserUpdatedUUID"
         )
-        SELECT gen_random_uuid(), false, iids."Json_ext" - 'first_name' - 'last_name' - 'dob', NOW(), NOW(), 1, NOW(), NULL, 'POTENTIAL', benefitPlan, new_entry."UUID", userUUID, userUUID
-        FROM individual_individualdatasource iids right join individual_individual new_entry on new_entry."UUID" = iids.individual_id
-        WHERE iids.upload_id=current_upload_id and iids."isDeleted"=false
-        AND (accepted IS NULL OR iids."UUID" = ANY(accepted));
+        SELECT gen_random_uuid(), false, to_import."Json_ext" - 'first_name' - 'last_name' - 'dob', NOW(), NOW(), 1, NOW(), NULL, 'POTENTIAL', benefitPlan, new_individual."UUID", userUUID, userUUID
+        FROM to_import JOIN new_individual ON new_individual."UUID" = to_import.individual_id;
     END IF;
 EXCEPTION WHEN OTHERS THEN
     UPDATE individual_individualdatasourceupload SET status = 'FAIL', error = jsonb_build_object(
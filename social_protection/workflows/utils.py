@@ -4,14 +4,21 @@ Functionalities shared between different python workflows.
 """
 import logging
 from abc import ABCMeta, abstractmethod
+from functools import cached_property
 from typing import Iterable
 
-from django.db import ProgrammingError, connection
+from django.db import ProgrammingError, connection, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 
+from core import datetime
 from core.models import User
-from individual.models import IndividualDataSource
-from social_protection.models import BenefitPlan
+from individual.models import IndividualDataSource, IndividualDataSourceUpload
+from social_protection.apps import SocialProtectionConfig
+from social_protection.models import BenefitPlan, JSONUpdate
+from social_protection.schema_validators import is_python_schema_validation_enabled, find_invalid_data_sources
 from social_protection.services import BeneficiaryImportService
+from social_protection.upload_metrics import upload_stage
 from social_protection.utils import load_dataframe
 from workflow.exceptions import PythonWorkflowHandlerException
 
@@ -30,10 +37,31 @@ class BasePythonWorkflowExecutor(metaclass=ABCMeta):
 
     def _load_df(self):
         benefit_plan = BenefitPlan.objects.filter(uuid=self.benefit_plan_uuid, is_deleted=False).first()
-        df = load_dataframe(IndividualDataSource.objects.filter(upload_id=self.upload_uuid))
         self.benefit_plan = benefit_plan
-        self.df = self.clean_data(df)
         self.schema = benefit_plan.beneficiary_data_schema
+        # Only headers and size of the upload are needed by most workflows, they are computed by the database
+        # and the DataFrame is loaded only if df is used
+        self.columns, self.row_count = self._get_upload_summary()
+
+    def _get_upload_summary(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT COUNT(DISTINCT ds."UUID"), COALESCE(ARRAY_AGG(DISTINCT json_key), '{{}}')
+                FROM {IndividualDataSource._meta.db_table} ds
+                LEFT JOIN LATERAL jsonb_object_keys(ds."Json_ext") AS json_key ON TRUE
+                WHERE ds.upload_id = %s::UUID
+            """, [str(self.upload_uuid)])
+            row_count, keys = cursor.fetchone()
+        # 'id' is added to the rows by load_dataframe, columns dropped by clean_data are ignored
+        columns = {*keys, 'id'} - {'Unnamed: 0'} if row_count else set()
+        return columns, row_count
+
+    @cached_property
+    def df(self):
+        return self.clean_data(load_dataframe(self._get_individual_sources()))
+
+    def _get_individual_sources(self):
+        return IndividualDataSource.objects.filter(upload_id=self.upload_uuid)
 
     @staticmethod
     def clean_data(df):
@@ -52,7 +80,7 @@ class BasePythonWorkflowExecutor(metaclass=ABCMeta):
         3. 'id' is field automatically added to DataFrame which is used for upload.
         4. If action is data upload then 'ID' unique identifier is required as well.
         """
-        df_headers = set(self.df.columns)
+        df_headers = set(self.columns)
         schema_properties = set(self.schema.get('properties', {}).keys())
         required_headers = {'first_name', 'last_name', 'dob', 'id'}
         if is_update:
@@ -97,7 +125,7 @@ class SqlProcedurePythonWorkflow(BasePythonWorkflowExecutor):
             raise PythonWorkflowHandlerException(str(e))
 
     def _execute_sql_logic(self, sql_func: str, params: Iterable):
-        with connection.cursor() as cursor:
+        with upload_stage(self.upload_uuid, 'sql_procedure', rows=self.row_count), connection.cursor() as cursor:
             current_upload_id = self.upload_uuid
             userUUID = self.user_uuid
             benefitPlan = self.benefit_plan_uuid
@@ -109,6 +137,131 @@ class SqlProcedurePythonWorkflow(BasePythonWorkflowExecutor):
             )
             # Process the cursor results or handle exceptions
 
+    def find_schema_failures(self):
+        """
+        Ids of the rows not matching the benefit plan schema, found with the precompiled schema validator.
+        None if the schema validation is left to the SQL procedure.
+        """
+        if not is_python_schema_validation_enabled():
+            return None
+        accepted = self.accepted if isinstance(self.accepted, list) else None
+        with upload_stage(self.upload_uuid, 'schema_validation', rows=self.row_count):
+            return find_invalid_data_sources(self.benefit_plan, self.upload_uuid, accepted)
+
+
+class BatchedSqlProcedurePythonWorkflow(SqlProcedurePythonWorkflow):
+    """
+    Executes the procedure in batches of data source key ranges, each batch is committed in its own transaction
+    together with the checkpoint stored in the upload json_ext['batch_checkpoint']. A workflow run again after
+    a crash continues after the last committed batch.
+
+    All statements are executed with named parameters: upload_id, user_id, benefit_plan_id and accepted (NULL if
+    all rows are processed). validation_sql is executed once, before the first batch, and sets the FAIL status
+    for uploads which can't be processed. batch_sql gets also lower_bound (exclusive) and upper_bound (inclusive)
+    data source ids, NULL for an open range. finalize_sql is executed in the transaction of the last batch.
+
+    Batches are committed only if the workflow isn't run in a transaction. In a transaction (e.g. of a mutation or
+    of a task resolution) every batch is only a savepoint, nothing is committed until the outer transaction is, and
+    its rollback discards both the processed batches and the checkpoints.
+    """
+    CHECKPOINT_KEY = 'batch_checkpoint'
+
+    def __init__(self, benefit_plan_uuid, upload_uuid, user_uuid, accepted=None, batch_size=None):
+        super().__init__(benefit_plan_uuid, upload_uuid, user_uuid, accepted)
+        self.batch_size = batch_size or SocialProtectionConfig.beneficiary_update_batch_size
+
+    def execute(self, validation_sql: str, batch_sql: str, finalize_sql: str = None):
+        try:
+            with upload_stage(self.upload_uuid, 'sql_procedure', rows=self.row_count):
+                self._execute_in_batches(validation_sql, batch_sql, finalize_sql)
+        except Exception as e:
+            # Committed batches are kept, running the workflow again continues from the checkpoint
+            logger.error(F'Error during batched beneficiary workflow, details:\n{str(e)}', exc_info=e)
+            # Merged into the errors already reported for the upload, e.g. by validation_sql
+            IndividualDataSourceUpload.objects.filter(id=self.upload_uuid).update(
+                status=IndividualDataSourceUpload.Status.FAIL,
+                error=JSONUpdate(
+                    Coalesce(F('error'), Value({}, output_field=models.JSONField())),
+                    Value('{workflow}'),
+                    Value({'error': str(e), 'upload_id': str(self.upload_uuid)}, output_field=models.JSONField()),
+                    output_field=models.JSONField(),
+                )
+            )
+
+    def _execute_in_batches(self, validation_sql, batch_sql, finalize_sql):
+        params = {
+            'upload_id': str(self.upload_uuid),
+            'user_id': str(self.user_uuid),
+            'benefit_plan_id': str(self.benefit_plan_uuid),
+            'accepted': self.accepted if isinstance(self.accepted, list) else None,
+        }
+        if connection.in_atomic_block:
+            logger.warning(
+                "Workflow of upload %s is run in a transaction, its batches and checkpoints are committed only "
+                "with the outer transaction and can't be resumed if it's rolled back", self.upload_uuid
+            )
+        checkpoint = self._get_checkpoint()
+        if checkpoint is None or checkpoint.get('finished'):
+            with connection.cursor() as cursor:
+                cursor.execute(validation_sql, params)
+            if self._get_upload_status() == IndividualDataSourceUpload.Status.FAIL:
+                return
+            checkpoint = {'last_id': None, 'batches': 0}
+        else:
+            logger.info("Resuming workflow of upload %s after batch %s", self.upload_uuid, checkpoint['batches'])
+            IndividualDataSourceUpload.objects.filter(id=self.upload_uuid).update(
+                status=IndividualDataSourceUpload.Status.IN_PROGRESS)
+
+        # The last batch has an open range, it includes the remaining rows and runs finalize_sql
+        upper_bounds = iter([*self._get_batch_upper_bounds(checkpoint['last_id']), None])
+        while not checkpoint.get('finished'):
+            lower_bound = checkpoint['last_id']
+            upper_bound = next(upper_bounds)
+            checkpoint = {
+                'last_id': str(upper_bound) if upper_bound else None,
+                'batches': checkpoint['batches'] + 1,
+                'finished': upper_bound is None,
+                'updated_at': datetime.datetime.now().isoformat(),
+            }
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(batch_sql, {**params, 'lower_bound': lower_bound, 'upper_bound': checkpoint['last_id']})
+                if checkpoint['finished'] and finalize_sql:
+                    cursor.execute(finalize_sql, params)
+                self._save_checkpoint(checkpoint)
+
+    def _get_batch_upper_bounds(self, lower_bound):
+        """
+        Ids of the last data source of every full batch after lower_bound, found with a single ordered scan.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id FROM (
+                    SELECT "UUID" AS id, row_number() OVER (ORDER BY "UUID") AS position
+                    FROM {IndividualDataSource._meta.db_table}
+                    WHERE upload_id = %(upload_id)s::UUID
+                      AND (%(lower_bound)s::UUID IS NULL OR "UUID" > %(lower_bound)s::UUID)
+                ) AS ordered
+                WHERE position %% %(batch_size)s = 0
+                ORDER BY id
+            """, {'upload_id': str(self.upload_uuid), 'lower_bound': lower_bound, 'batch_size': self.batch_size})
+            return [str(row[0]) for row in cursor.fetchall()]
+
+    def _get_checkpoint(self):
+        json_ext = IndividualDataSourceUpload.objects.filter(id=self.upload_uuid).values_list('json_ext', flat=True).first()
+        return (json_ext or {}).get(self.CHECKPOINT_KEY)
+
+    def _get_upload_status(self):
+        return IndividualDataSourceUpload.objects.filter(id=self.upload_uuid).values_list('status', flat=True).first()
+
+    def _save_checkpoint(self, checkpoint):
+        # Queryset update, so the checkpoint is committed with the batch without creating a new upload version
+        IndividualDataSourceUpload.objects.filter(id=self.upload_uuid).update(json_ext=JSONUpdate(
+            Coalesce(F('json_ext'), Value({}, output_field=models.JSONField())),
+            Value(f'{{{self.CHECKPOINT_KEY}}}'),
+            Value(checkpoint, output_field=models.JSONField()),
+            output_field=models.JSONField(),
+        ))
+
 
 class MakerCheckerPythonWorkflowExecutor(SqlProcedurePythonWorkflow, metaclass=ABCMeta):
     """
@@ -153,39 +306,43 @@ class MakerCheckerPythonWorkflowExecutor(SqlProcedurePythonWorkflow, metaclass=A
             raise PythonWorkflowHandlerException(str(e))
 
 
-class DataUploadWorkflow(MakerCheckerPythonWorkflowExecutor):
+class ImportServiceWorkflowExecutor(MakerCheckerPythonWorkflowExecutor, metaclass=ABCMeta):
+    """
+    Maker-checker executor validating the upload with the beneficiary import service. The upload is validated
+    once per executor, using the DataFrame already loaded by the executor.
+    """
 
     def __init__(self, benefit_plan_uuid, upload_uuid, user_uuid, import_service=BeneficiaryImportService):
         super().__init__(benefit_plan_uuid, upload_uuid, user_uuid)
         self.import_service = import_service(self.user)
 
-    @property
-    def should_create_task(self):
-        validation_response = self.import_service.validate_import_beneficiaries(
+    @cached_property
+    def df(self):
+        # Validation reads only the fields of the schema and 'ID' of the updated beneficiaries
+        columns = [*self.schema.get('properties', {}), 'ID']
+        return self.clean_data(load_dataframe(self._get_individual_sources(), columns))
+
+    @cached_property
+    def validation_response(self):
+        return self.import_service.validate_import_beneficiaries(
             upload_id=self.upload_uuid,
-            individual_sources=IndividualDataSource.objects.filter(upload_id=self.upload_uuid),
-            benefit_plan=self.benefit_plan
+            individual_sources=self._get_individual_sources(),
+            benefit_plan=self.benefit_plan,
+            dataframe=self.df
         )
-        return validation_response['summary_invalid_items'] or True  # Replace this with config check
 
-    def _create_task_function(self):
-        self.import_service.create_task_with_importing_valid_items(self.upload_uuid, self.benefit_plan)
+    @property
+    def should_create_task(self):
+        return self.validation_response['summary_invalid_items'] or True  # Replace this with config check
 
 
-class DataUpdateWorkflow(MakerCheckerPythonWorkflowExecutor):
+class DataUploadWorkflow(ImportServiceWorkflowExecutor):
 
-    def __init__(self, benefit_plan_uuid, upload_uuid, user_uuid, import_service=BeneficiaryImportService):
-        super().__init__(benefit_plan_uuid, upload_uuid, user_uuid)
-        self.import_service = import_service(self.user)
+    def _create_task_function(self):
+        self.import_service.create_task_with_importing_valid_items(self.upload_uuid, self.benefit_plan)
 
-    @property
-    def should_create_task(self):
-        validation_response = self.import_service.validate_import_beneficiaries(
-            upload_id=self.upload_uuid,
-            individual_sources=IndividualDataSource.objects.filter(upload_id=self.upload_uuid),
-            benefit_plan=self.benefit_plan
-        )
-        return validation_response['summary_invalid_items'] or True  # Replace this with config check
+
+class DataUpdateWorkflow(ImportServiceWorkflowExecutor):
 
     def _create_task_function(self):
         self.import_service.create_task_with_update_valid_items(self.upload_uuid, self.benefit_plan)